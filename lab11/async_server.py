@@ -0,0 +1,148 @@
+import asyncio
+
+from communication import (
+    encode_frames,
+    receive_first_message_async,
+    receive_message_async,
+    send_message_async,
+)
+
+
+class AsyncChatServer:
+    """
+    Chat server that handles all clients in a single thread with asyncio.
+
+    Broadcasts are written without waiting for the clients, so a client that
+    stops reading would grow its write buffer without limit. Messages to a
+    client with more than max_write_buffer bytes unsent are dropped instead.
+    """
+
+    def __init__(
+        self, host="localhost", port=8010, backlog=4096, max_write_buffer=1 << 20
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.max_write_buffer = max_write_buffer
+        self.dropped = 0
+        self.clients = {}
+        self.versions = {}
+
+    async def listen_client(self, client_name: str, reader: asyncio.StreamReader) -> None:
+        """
+        Continuously listens for messages from a client and broadcasts it to all connected clients.
+        """
+        version = self.versions[client_name]
+        try:
+            while True:
+                message = await receive_message_async(reader, version=version)
+                if message == "/exit":
+                    break
+                # clients replaying history get an empty one, since none is kept here
+                if message.startswith("/since "):
+                    await send_message_async(
+                        self.clients[client_name], "/history 0", version=version
+                    )
+                    continue
+                self.notify_clients(f"{client_name}: {message}", exclude={client_name})
+        except ConnectionError:
+            pass
+        finally:
+            writer = self.clients.pop(client_name)
+            del self.versions[client_name]
+            writer.close()
+            print(f"{client_name} has left the chat.")
+            self.notify_clients(f"{client_name} has left the chat.")
+
+    def notify_clients(self, message: str, exclude: set[str] = frozenset()) -> None:
+        """
+        Notifies all connected clients except those in the exclude set with the given message.
+        """
+        frames = encode_frames(message)
+        for name, writer in self.clients.items():
+            # version 1 clients can't receive messages longer than their prefix
+            if name in exclude or frames[self.versions[name]] is None:
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_write_buffer:
+                self.dropped += 1
+                continue
+            writer.write(frames[self.versions[name]])
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Handles a newly connected client."""
+        print(f"New connection from {writer.get_extra_info('peername')}")
+        try:
+            name = await self.get_client_name(reader, writer)
+        except Exception as e:
+            print(f"Error handling client: {e}")
+            writer.close()
+            return
+        print(f"{name} has joined the chat.")
+        self.notify_clients(f"{name} has joined the chat.", exclude={name})
+        await self.listen_client(name, reader)
+
+    async def get_client_name(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> str:
+        """
+        Gets the name of the client, adds client to the clients dictionary, and returns the name.
+        """
+        # the greeting is sent before the protocol version of the client is known
+        await send_message_async(writer, "What is your name?")
+        name, version = await receive_first_message_async(reader)
+        while True:
+            # names are at the start of broadcasts, where "/" marks commands and
+            # "#<sequence number> " precedes room messages of the threaded server
+            if name.startswith(("/", "#")):
+                await send_message_async(
+                    writer,
+                    'Names can\'t start with "/" or "#". Please choose another name.',
+                    version=version,
+                )
+                name = await receive_message_async(reader, version=version)
+                continue
+            if any(char.isspace() for char in name):
+                await send_message_async(
+                    writer,
+                    "Names can't contain spaces. Please choose another name.",
+                    version=version,
+                )
+                name = await receive_message_async(reader, version=version)
+                continue
+            # no await between the check and the insert, so the name can't be taken meanwhile
+            if name not in self.clients:
+                self.clients[name] = writer
+                self.versions[name] = version
+                try:
+                    await send_message_async(writer, "Welcome to the chat!", version=version)
+                except ConnectionError:
+                    del self.clients[name], self.versions[name]
+                    raise
+                return name
+            await send_message_async(
+                writer, "Name already taken. Please choose another name.", version=version
+            )
+            name = await receive_message_async(reader, version=version)
+
+    async def serve(self) -> None:
+        """Accepts clients and handles each of them in its own task."""
+        server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, backlog=self.backlog
+        )
+        print(f"Server started on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def run_server(self) -> None:
+        """Runs the chat server until interrupted."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    chat_server = AsyncChatServer(host="localhost", port=8010)
+    chat_server.run_server()
@@ -0,0 +1,173 @@
+"""
+Module for the durable append-only log of chat messages.
+
+The log is a directory of segment files named after the number of the first
+record they hold. Every record is a JSON object framed like a version 2 message,
+so a record torn by a crash is recognized by its header and cut off on recovery.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from communication import HEADER, encode_message_v2
+
+SEGMENT_SUFFIX = ".log"
+
+
+class ChatLog:
+    """
+    Write-ahead log that appends records from a background writer thread.
+
+    Appending only queues the record, so broadcasts never wait for the disk. The
+    writer writes all queued records at once and syncs them with a single fsync
+    when sync_batch records are queued or sync_interval seconds after the first
+    of them was queued, so a crash loses at most that window of messages.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 64 << 20,
+        sync_interval: float = 0.05,
+        sync_batch: int = 256,
+    ) -> None:
+        """
+        :param directory: the directory with segment files, created if missing
+        :param segment_size: the size in bytes after which a new segment is started
+        :param sync_interval: the maximum time in seconds a record waits for fsync
+        :param sync_batch: the number of queued records that are synced right away
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(
+            name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)
+        )
+        self.records_written = 0
+        self.file = None
+        if self.segments:
+            self._recover_last_segment()
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.syncs = 0
+        self.writer = threading.Thread(target=self.write_records, daemon=True)
+        self.writer.start()
+
+    def segment_path(self, segment: str) -> str:
+        return os.path.join(self.directory, segment)
+
+    def read_segment(self, segment: str) -> tuple[list[dict], int]:
+        """
+        Reads records of the segment, stopping at a torn or corrupted record.
+
+        :param segment: the name of the segment file
+        :return: the records and the size of the valid part of the segment in bytes
+        """
+        with open(self.segment_path(segment), "rb") as f:
+            data = f.read()
+        records = []
+        position = 0
+        while position + HEADER.size <= len(data):
+            (length,) = HEADER.unpack_from(data, position)
+            start = position + HEADER.size
+            if start + length > len(data):
+                break
+            try:
+                records.append(json.loads(data[start:start + length]))
+            except ValueError:
+                break
+            position = start + length
+        return records, position
+
+    def _recover_last_segment(self) -> None:
+        """Cuts off a record torn by a crash so that new records follow valid ones."""
+        segment = self.segments[-1]
+        records, size = self.read_segment(segment)
+        with open(self.segment_path(segment), "r+b") as f:
+            f.truncate(size)
+        self.records_written = int(segment.removesuffix(SEGMENT_SUFFIX)) + len(records)
+        self.file = open(self.segment_path(segment), "ab")
+
+    def read_records(self, segments: int | None = None):
+        """
+        Yields records of the last segments in the order they were appended.
+
+        :param segments: the number of segments to read from the end of the log,
+            None to read the whole log
+        :return: generator of the record dictionaries
+        """
+        names = self.segments if segments is None else self.segments[-segments:]
+        for segment in names:
+            yield from self.read_segment(segment)[0]
+
+    def append(self, sequence: int | None, room: str | None, message: str) -> None:
+        """Queues the message for writing without waiting for the disk."""
+        record = {"time": time.time(), "sequence": sequence, "room": room, "message": message}
+        with self.condition:
+            if self.closed:
+                raise ValueError("Chat log is closed")
+            self.queue.append(encode_message_v2(json.dumps(record)))
+            # wake the writer to start the sync interval or to sync a full batch
+            if len(self.queue) == 1 or len(self.queue) >= self.sync_batch:
+                self.condition.notify()
+
+    def write_records(self) -> None:
+        """Writes and syncs queued records in groups until the log is closed."""
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                deadline = time.monotonic() + self.sync_interval
+                while (
+                    not self.closed
+                    and len(self.queue) < self.sync_batch
+                    and (timeout := deadline - time.monotonic()) > 0
+                ):
+                    self.condition.wait(timeout)
+                records = list(self.queue)
+                self.queue.clear()
+                closed = self.closed
+            if records:
+                self._write(records)
+            if closed:
+                return
+
+    def _write(self, records: list[bytes]) -> None:
+        """Writes the records to the current segment and syncs it."""
+        if self.file is None or self.file.tell() >= self.segment_size:
+            self._rotate()
+        self.file.write(b"".join(records))
+        self.file.flush()
+        os.fdatasync(self.file.fileno())
+        self.records_written += len(records)
+        self.syncs += 1
+
+    def _rotate(self) -> None:
+        """Closes the current segment and starts a new one."""
+        if self.file is not None:
+            self.file.close()
+        segment = f"{self.records_written:020d}{SEGMENT_SUFFIX}"
+        self.file = open(self.segment_path(segment), "ab")
+        if segment not in self.segments:
+            self.segments.append(segment)
+            # make the new directory entry durable as well
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def close(self) -> None:
+        """Writes the remaining records and closes the log."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.writer.join()
+        if self.file is not None:
+            self.file.close()
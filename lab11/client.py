@@ -1,10 +1,11 @@
 import socket
 import sys
 import threading
+import time
 import tty
 import termios
 
-from communication import send_message, receive_message
+from communication import PROTOCOL_V2_MAGIC, MessageReader, send_message
 
 
 class ChatClient:
@@ -12,14 +13,26 @@ class ChatClient:
         self.user_input = ''
         self.host = host
         self.port = port
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.client_socket = None
+        self.reader = None
         self.received_messages = []
+        self.name = None
+        self.room = None
+        # the sequence number of the last received room message
+        self.last_sequence = 0
+
+    def connect(self) -> None:
+        """Opens a new connection to the server using version 2 of the protocol."""
+        self.client_socket = socket.create_connection((self.host, self.port))
+        self.client_socket.sendall(PROTOCOL_V2_MAGIC)
+        self.reader = MessageReader(self.client_socket)
 
     def run_client(self) -> None:
         """Runs the chat client."""
-        self.client_socket.connect((self.host, self.port))
+        self.connect()
         try:
             self.send_client_name()
+            send_message(self.client_socket, f"/since {self.last_sequence}", version=2)
             threading.Thread(target=self.receive_and_display_messages, daemon=True).start()
             fd = sys.stdin.fileno()
             old_settings = termios.tcgetattr(fd)
@@ -43,7 +56,14 @@ class ChatClient:
                 print(f' \r\033[K> {self.user_input} ', end="", flush=True)
             elif character == '\r':  # Enter
                 self.user_input = self.user_input[:-1]
-                send_message(self.client_socket, self.user_input)
+                try:
+                    send_message(self.client_socket, self.user_input, version=2)
+                except OSError:
+                    print("\r\033[KNot connected, the message was not sent.", end="")
+                if self.user_input.startswith("/join "):
+                    self.room = self.user_input.removeprefix("/join ").strip()
+                elif self.user_input == "/leave":
+                    self.room = None
                 if self.user_input == "/exit":
                     break
                 self.user_input = ''
@@ -53,23 +73,119 @@ class ChatClient:
 
     def send_client_name(self) -> None:
         """Sends the client's name to the server."""
-        message = receive_message(self.client_socket)
+        message = self.reader.receive()
+        # the server greets using version 1 of the protocol and then switches to version 2
+        self.reader.version = 2
         while not message == "Welcome to the chat!":
             print(message)
             name = input("Enter your name: ")
-            send_message(self.client_socket, name)
-            message = receive_message(self.client_socket)
+            send_message(self.client_socket, name, version=2)
+            message = self.reader.receive()
+        self.name = name
         print(message)
 
+    def rejoin(self) -> None:
+        """
+        Logs in with the same name on a new connection, returns to the room and
+        requests the room messages missed since the last received one.
+
+        :raises ConnectionError: if the client could not log in
+        """
+        self.connect()
+        self.reader.receive()
+        self.reader.version = 2
+        send_message(self.client_socket, self.name, version=2)
+        message = self.reader.receive()
+        if message != "Welcome to the chat!":
+            self.client_socket.close()
+            raise ConnectionError(message)
+        if self.room:
+            send_message(self.client_socket, f"/join {self.room}", version=2)
+        send_message(self.client_socket, f"/since {self.last_sequence}", version=2)
+
+    def reconnect(self, max_delay: float = 30) -> None:
+        """Reconnects to the server, waiting twice as long after every failed attempt."""
+        delay = 0.5
+        while True:
+            time.sleep(delay)
+            try:
+                self.rejoin()
+                return
+            except (ConnectionError, OSError):
+                delay = min(delay * 2, max_delay)
+
+    def display_message(self, message: str) -> None:
+        self.received_messages.append(message)
+        print(f"\r\033[K{message}\n\r> {self.user_input}", end="", flush=True)
+
+    def handle_message(self, message: str) -> None:
+        """
+        Displays the message, unpacking history frames and sequence numbers,
+        and answers pings of the server.
+        """
+        if message == "/ping":
+            send_message(self.client_socket, "/pong", version=2)
+            return
+        if message.startswith("/history "):
+            header, _, body = message.partition("\n")
+            last_sequence = header.removeprefix("/history ")
+            try:
+                entries = self.split_history(body)
+            except ValueError:
+                entries = None
+            if last_sequence.isdigit() and entries is not None:
+                for sequence, entry in entries:
+                    self.last_sequence = max(self.last_sequence, sequence)
+                    self.display_message(entry)
+                self.last_sequence = max(self.last_sequence, int(last_sequence))
+                return
+        sequence, _, text = message.partition(" ")
+        if sequence.startswith("#") and sequence[1:].isdigit():
+            self.last_sequence = max(self.last_sequence, int(sequence[1:]))
+            message = text
+        self.display_message(message)
+
+    @staticmethod
+    def split_history(body: str) -> list[tuple[int, str]]:
+        """
+        Splits the body of a history frame into messages with their sequence numbers.
+
+        :param body: lines "#<sequence number> <length> <message>" joined with newlines
+        :return: list of (sequence number, message)
+        :raises ValueError: if the body is not made of such lines
+        """
+        entries = []
+        position = 0
+        while position < len(body):
+            sequence_end = body.index(" ", position)
+            length_end = body.index(" ", sequence_end + 1)
+            sequence = body[position + 1 : sequence_end]
+            length = body[sequence_end + 1 : length_end]
+            end = length_end + 1 + int(length) if length.isdigit() else -1
+            if (
+                body[position] != "#"
+                or not sequence.isdigit()
+                or not length_end < end <= len(body)
+                or body[end : end + 1] not in ("", "\n")
+            ):
+                raise ValueError(f"Malformed history entry at {position}")
+            entries.append((int(sequence), body[length_end + 1 : end]))
+            position = end + 1
+        return entries
+
     def receive_and_display_messages(self) -> None:
-        """Continuously receive messages from the server and display them in real-time."""
+        """
+        Continuously receive messages from the server and display them in real-time,
+        reconnecting when the connection is lost.
+        """
         while True:
             try:
-                message = receive_message(self.client_socket)
-                print(f"\r{message}\n\r> {self.user_input}", end="", flush=True)
+                self.handle_message(self.reader.receive())
             except ConnectionError:
-                print("\rConnection to server lost.")
-                break
+                print("\r\033[KConnection to server lost, reconnecting...")
+                self.client_socket.close()
+                self.reconnect()
+                print("\r\033[KReconnected.\n\r> ", end="", flush=True)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,78 @@
-"""Module for sending and receiving length-prefixed messages over a socket."""
+"""
+Module for sending and receiving length-prefixed messages over a socket.
 
+Version 1 of the protocol prefixes every message with its length in characters
+written as ASCII digits. Version 2 prefixes the UTF-8 encoded message with its
+length in bytes as a 4-byte big-endian integer. A client chooses version 2 by
+sending PROTOCOL_V2_MAGIC right after connecting; the server greets every client
+using version 1 and switches to version 2 for the rest of the connection.
+"""
+
+import asyncio
 import socket
+import struct
+
+PROTOCOL_V2_MAGIC = b"\x00CH2"
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 1 << 20
+RECEIVE_SIZE = 1 << 16
+
+
+def encode_message(message: str, prefix_length: int = 4) -> bytes:
+    """
+    Encodes a message together with its length prefix.
+
+    :param message: the message to encode
+    :param prefix_length: the length of the message prefix in digits
+    :return: the bytes to send over the socket
+    :raises ValueError: if the length of the message doesn't fit in the prefix
+    """
+    if len(message) >= 10**prefix_length:
+        raise ValueError(f"Message of {len(message)} characters is too long")
+    return f"{len(message):0{prefix_length}d}".encode() + message.encode()
+
+
+def encode_message_v2(message: str) -> bytes:
+    """
+    Encodes a message together with its binary length header.
+
+    :param message: the message to encode
+    :return: the bytes to send over the socket
+    """
+    data = message.encode()
+    return HEADER.pack(len(data)) + data
+
+
+def encode_frames(message: str) -> dict[int, bytes | None]:
+    """
+    Encodes a message once for every version of the protocol.
+
+    :param message: the message to encode
+    :return: the frames by the version, None for version 1 if the message is too
+        long for its prefix
+    """
+    try:
+        frame = encode_message(message)
+    except ValueError:
+        frame = None
+    return {1: frame, 2: encode_message_v2(message)}
 
 
 def send_message(
-    client_socket: socket.socket, message: str, prefix_length: int = 4
+    client_socket: socket.socket, message: str, prefix_length: int = 4, version: int = 1
 ) -> None:
     """
-    Sends a length-prefixed message over the socket.
+    Sends a length-prefixed message over the socket with a single write.
 
     :param client_socket: the socket to send the message over
     :param message: the message to send
     :param prefix_length: the length of the message prefix in digits
+    :param version: the version of the protocol
     """
-    length = len(message)
-    client_socket.sendall(f"{length:0{prefix_length}d}".encode())
-    client_socket.sendall(message.encode())
+    if version == 2:
+        client_socket.sendall(encode_message_v2(message))
+    else:
+        client_socket.sendall(encode_message(message, prefix_length))
 
 
 def receive_message(client_socket: socket.socket, prefix_length: int = 4) -> str:
@@ -27,8 +84,153 @@ def receive_message(client_socket: socket.socket, prefix_length: int = 4) -> str
     :return: the received message
     :raises ConnectionError: if the message could not be received
     """
+    return MessageReader(client_socket, prefix_length=prefix_length, receive_size=0).receive()
+
+
+class MessageReader:
+    """
+    Buffered reader of length-prefixed messages.
+
+    Frames split across several receives are reassembled, and several frames
+    received at once are returned one by one.
+    """
+
+    def __init__(
+        self,
+        client_socket: socket.socket,
+        version: int = 1,
+        prefix_length: int = 4,
+        detect_version: bool = False,
+        receive_size: int = RECEIVE_SIZE,
+    ) -> None:
+        """
+        :param client_socket: the socket to receive messages from
+        :param version: the version of the protocol
+        :param prefix_length: the length of the version 1 message prefix in digits
+        :param detect_version: whether the peer may start with PROTOCOL_V2_MAGIC
+        :param receive_size: the maximum number of bytes to receive at once,
+            0 to receive only the bytes of the current frame
+        """
+        self.socket = client_socket
+        self.version = version
+        self.prefix_length = prefix_length
+        self.detect_version = detect_version
+        self.receive_size = receive_size
+        self.buffer = bytearray()
+        self.bytes_received = 0
+
+    def _fill(self, size: int) -> None:
+        """Receives until the buffer holds at least size bytes."""
+        while len(self.buffer) < size:
+            try:
+                data = self.socket.recv(max(self.receive_size, size - len(self.buffer)))
+            except OSError as e:
+                raise ConnectionError from e
+            if not data:
+                raise ConnectionError("Connection closed")
+            self.bytes_received += len(data)
+            self.buffer += data
+
+    def _take(self, size: int) -> bytes:
+        self._fill(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def receive(self) -> str:
+        """
+        Receives the next message.
+
+        :return: the received message
+        :raises ConnectionError: if the message could not be received
+        """
+        if self.detect_version:
+            self.detect_version = False
+            self._fill(len(PROTOCOL_V2_MAGIC))
+            if self.buffer.startswith(PROTOCOL_V2_MAGIC):
+                del self.buffer[: len(PROTOCOL_V2_MAGIC)]
+                self.version = 2
+        try:
+            if self.version == 2:
+                (length,) = HEADER.unpack(self._take(HEADER.size))
+            else:
+                header = self._take(self.prefix_length)
+                # int would also accept a sign or spaces
+                if not header.isdigit():
+                    raise ValueError(f"Invalid length prefix {header!r}")
+                length = int(header)
+            if length > MAX_MESSAGE_SIZE:
+                raise ValueError(f"Message of {length} bytes is too long")
+            return self._take(length).decode()
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ConnectionError from e
+
+
+async def send_message_async(
+    writer: asyncio.StreamWriter, message: str, prefix_length: int = 4, version: int = 1
+) -> None:
+    """
+    Sends a length-prefixed message over the asyncio stream.
+
+    :param writer: the stream to send the message over
+    :param message: the message to send
+    :param prefix_length: the length of the message prefix in digits
+    :param version: the version of the protocol
+    """
+    if version == 2:
+        writer.write(encode_message_v2(message))
+    else:
+        writer.write(encode_message(message, prefix_length))
+    await writer.drain()
+
+
+async def receive_message_async(
+    reader: asyncio.StreamReader,
+    prefix_length: int = 4,
+    version: int = 1,
+    prefix: bytes = b"",
+) -> str:
+    """
+    Receives a length-prefixed message from the asyncio stream.
+
+    :param reader: the stream to receive the message from
+    :param prefix_length: the length of the message prefix in digits
+    :param version: the version of the protocol
+    :param prefix: the beginning of the length prefix that was already read
+    :return: the received message
+    :raises ConnectionError: if the message could not be received
+    """
+    try:
+        if version == 2:
+            header = prefix + await reader.readexactly(HEADER.size - len(prefix))
+            (length,) = HEADER.unpack(header)
+        else:
+            header = prefix + await reader.readexactly(prefix_length - len(prefix))
+            if not header.isdigit():
+                raise ValueError(f"Invalid length prefix {header!r}")
+            length = int(header)
+        if length > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message of {length} bytes is too long")
+        return (await reader.readexactly(length)).decode()
+    except (asyncio.IncompleteReadError, ValueError, OSError) as e:
+        raise ConnectionError from e
+
+
+async def receive_first_message_async(
+    reader: asyncio.StreamReader, prefix_length: int = 4
+) -> tuple[str, int]:
+    """
+    Receives the first message of a peer that may start with PROTOCOL_V2_MAGIC.
+
+    :param reader: the stream to receive the message from
+    :param prefix_length: the length of the version 1 message prefix in digits
+    :return: the received message and the version of the protocol used by the peer
+    :raises ConnectionError: if the message could not be received
+    """
     try:
-        prefix_length = int(client_socket.recv(prefix_length).decode())
-        return client_socket.recv(prefix_length).decode()
-    except:
-        raise ConnectionError
+        start = await reader.readexactly(len(PROTOCOL_V2_MAGIC))
+    except (asyncio.IncompleteReadError, OSError) as e:
+        raise ConnectionError from e
+    if start == PROTOCOL_V2_MAGIC:
+        return await receive_message_async(reader, version=2), 2
+    return await receive_message_async(reader, prefix_length, prefix=start), 1
@@ -0,0 +1,174 @@
+"""Module for client connections with their own outbound message queues."""
+
+import socket
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+from communication import MessageReader, encode_message, encode_message_v2
+
+
+# the limit of buffers in a single sendmsg call on Linux
+MAX_BATCH = 1024
+
+
+class SlowClientPolicy(Enum):
+    """What to do when the outbound queue of a client is full."""
+
+    DROP_OLDEST = "drop_oldest"
+    DISCONNECT = "disconnect"
+
+
+class ClientConnection:
+    """
+    A client socket with a bounded queue of encoded messages drained by a writer thread.
+
+    Queuing never blocks, so a client that stops reading only affects its own queue.
+    The writer sends all queued messages with a single sendmsg call. With a flush
+    window it also waits that long after the first queued message for more of them,
+    which adds at most flush_window seconds of latency. The wait ends early once a
+    full batch is queued, so a burst doesn't overflow the queue of a fast reader.
+    """
+
+    def __init__(
+        self,
+        client_socket: socket.socket,
+        max_queue_size: int = 256,
+        slow_client_policy: SlowClientPolicy = SlowClientPolicy.DROP_OLDEST,
+        flush_window: float = 0.0,
+        tcp_nodelay: bool = True,
+    ) -> None:
+        self.socket = client_socket
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, tcp_nodelay)
+        self.reader = MessageReader(client_socket, detect_version=True)
+        self.name = None
+        self.max_queue_size = max_queue_size
+        self.slow_client_policy = slow_client_policy
+        self.flush_window = flush_window
+        # the number of queued messages that are sent without waiting for the window,
+        # half of the queue, so it still has room while the writer wakes up
+        self.batch_size = min(MAX_BATCH, max(max_queue_size // 2, 1))
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        # whether room messages are sent with their sequence numbers
+        self.sequenced = False
+        self.send_calls = 0
+        self.bytes_sent = 0
+        self.last_received = time.monotonic()
+        threading.Thread(target=self.write_messages, daemon=True).start()
+
+    @property
+    def version(self) -> int:
+        """The version of the protocol detected from the first message of the client."""
+        return self.reader.version
+
+    @property
+    def bytes_received(self) -> int:
+        return self.reader.bytes_received
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of messages waiting to be sent."""
+        return len(self.queue)
+
+    def enable_keepalive(self, idle: float, interval: float, count: int) -> None:
+        """
+        Makes the kernel probe the peer after idle seconds without traffic and
+        close the connection after count unanswered probes sent interval seconds apart.
+        """
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(idle)))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(interval)))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+    def receive_message(self) -> str:
+        """Receives the next message from the client."""
+        message = self.reader.receive()
+        self.last_received = time.monotonic()
+        return message
+
+    def send_message(self, message: str) -> None:
+        """
+        Encodes the message for the protocol version of the client and queues it.
+
+        A message too long for the prefix of version 1 is counted as dropped.
+        """
+        if self.version == 2:
+            self.send(encode_message_v2(message))
+            return
+        try:
+            self.send(encode_message(message))
+        except ValueError:
+            with self.condition:
+                self.dropped += 1
+
+    def send(self, data: bytes) -> None:
+        """Queues the encoded message for sending without waiting for the socket."""
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.queue) >= self.max_queue_size:
+                self.dropped += 1
+                if self.slow_client_policy == SlowClientPolicy.DISCONNECT:
+                    self._shutdown()
+                    return
+                self.queue.popleft()
+            self.queue.append(data)
+            # the writer waiting out the flush window only needs to wake for a full batch
+            if len(self.queue) == 1 or len(self.queue) >= self.batch_size:
+                self.condition.notify()
+
+    def write_messages(self) -> None:
+        """Sends queued messages in batches until the connection is closed."""
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                deadline = time.monotonic() + self.flush_window
+                while (
+                    not self.closed
+                    and len(self.queue) < self.batch_size
+                    and (timeout := deadline - time.monotonic()) > 0
+                ):
+                    self.condition.wait(timeout)
+                if self.closed:
+                    return
+                frames = [
+                    self.queue.popleft() for _ in range(min(len(self.queue), MAX_BATCH))
+                ]
+            try:
+                self._send_frames(frames)
+            except OSError:
+                self.close()
+                return
+
+    def _send_frames(self, frames: list[bytes]) -> None:
+        """Sends the frames with as few sendmsg calls as the socket allows."""
+        frames = [memoryview(frame) for frame in frames]
+        while frames:
+            sent = self.socket.sendmsg(frames)
+            self.send_calls += 1
+            self.bytes_sent += sent
+            while frames and sent >= len(frames[0]):
+                sent -= len(frames.pop(0))
+            if sent:
+                frames[0] = frames[0][sent:]
+
+    def _shutdown(self) -> None:
+        """Stops the writer and unblocks the thread reading from the socket."""
+        self.closed = True
+        self.queue.clear()
+        self.condition.notify()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """Closes the connection, discarding messages that were not sent yet."""
+        with self.condition:
+            self._shutdown()
+        self.socket.close()
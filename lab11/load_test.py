@@ -0,0 +1,294 @@
+"""
+Load test for the chat servers.
+
+The idle test measures server memory and CPU per connected chat client. The
+fan-out test makes some of the clients send messages at a fixed rate and measures
+the latency from sending a message until each of the other clients receives it.
+"""
+
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import sys
+import time
+from collections import Counter
+
+from communication import (
+    PROTOCOL_V2_MAGIC,
+    receive_message_async,
+    send_message_async,
+)
+
+SERVERS = {
+    "threaded": ("server", "ChatServer"),
+    "async": ("async_server", "AsyncChatServer"),
+}
+# prefix of messages sent by the fan-out test
+PROBE = "probe"
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with logarithmic buckets.
+
+    Every bucket is precision times wider than the previous one, so percentiles
+    have bounded relative error while the memory does not grow with the samples.
+    """
+
+    def __init__(self, precision: float = 0.01) -> None:
+        self.base = math.log1p(precision)
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, latency: float) -> None:
+        self.buckets[math.ceil(math.log(max(latency, 1e-9)) / self.base)] += 1
+        self.count += 1
+        self.max = max(self.max, latency)
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Returns the upper bound of the bucket with the given percentile.
+
+        :param percentile: the percentile from 0 to 100
+        :return: the latency in seconds, 0 if there are no samples
+        """
+        rank = math.ceil(self.count * percentile / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(math.exp(bucket * self.base), self.max)
+        return 0.0
+
+
+def raise_open_files_limit() -> None:
+    """Allows the process to open as many sockets as the hard limit permits."""
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def run_server(server: str, host: str, port: int) -> None:
+    """
+    Runs the chosen chat server with its output suppressed.
+
+    :param server: a name from SERVERS or "module:Class" of another server class
+        taking host and port and having a run_server method
+    """
+    raise_open_files_limit()
+    sys.stdout = open(os.devnull, "w")
+    module_name, class_name = SERVERS.get(server) or server.split(":")
+    module = __import__(module_name)
+    getattr(module, class_name)(host=host, port=port).run_server()
+
+
+def process_usage(pid: int) -> tuple[int, float]:
+    """Returns resident memory in bytes and CPU time in seconds of the process."""
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_time = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss, cpu_time
+
+
+async def connect_client(
+    host: str, port: int, name: str, version: int = 1
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Connects to the server and completes the name handshake."""
+    reader, writer = await asyncio.open_connection(host, port)
+    if version == 2:
+        writer.write(PROTOCOL_V2_MAGIC)
+    await receive_message_async(reader)
+    await send_message_async(writer, name, version=version)
+    message = await receive_message_async(reader, version=version)
+    if message != "Welcome to the chat!":
+        raise ConnectionError(message)
+    return reader, writer
+
+
+async def connect_clients(
+    host: str, port: int, count: int, concurrency: int = 200, version: int = 1
+) -> list:
+    """Connects the given number of idle clients, limiting concurrent handshakes."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(index: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        async with semaphore:
+            return await connect_client(host, port, f"user{index}", version)
+
+    return await asyncio.gather(*(connect(index) for index in range(count)))
+
+
+def wait_for_server(host: str, port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+async def measure_idle_clients(pid: int, host: str, port: int, count: int, idle: float) -> None:
+    rss_before, cpu_before = process_usage(pid)
+    start = time.monotonic()
+    clients = await connect_clients(host, port, count)
+    connect_time = time.monotonic() - start
+    rss_connected, cpu_connected = process_usage(pid)
+    await asyncio.sleep(idle)
+    rss_idle, cpu_idle = process_usage(pid)
+    print(f"{count} clients connected in {connect_time:.2f} s")
+    print(f"memory per client: {(rss_idle - rss_before) / count / 1024:.1f} KB")
+    print(f"CPU per client to connect: {(cpu_connected - cpu_before) / count * 1e6:.0f} us")
+    print(f"CPU while idle for {idle} s: {cpu_idle - cpu_connected:.3f} s")
+    for _, writer in clients:
+        writer.close()
+
+
+async def receive_probes(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    version: int,
+    histogram: LatencyHistogram,
+) -> None:
+    """Records the latency of every probe message received by a client."""
+    try:
+        while True:
+            message = await receive_message_async(reader, version=version)
+            if message == "/ping":
+                await send_message_async(writer, "/pong", version=version)
+                continue
+            # messages are broadcast as "<sender>: probe <send time>"
+            _, _, text = message.partition(": ")
+            if text.startswith(PROBE):
+                histogram.add(time.perf_counter() - float(text.split()[1]))
+    except ConnectionError:
+        pass
+
+
+async def send_probes(
+    writers: list[asyncio.StreamWriter], version: int, rate: float, duration: float
+) -> int:
+    """
+    Sends probe messages from random clients at the given total rate.
+
+    :return: the number of sent messages
+    """
+    sent = 0
+    start = time.perf_counter()
+    while (now := time.perf_counter()) - start < duration:
+        # catch up on messages that are late instead of drifting from the rate
+        while sent < (now - start) * rate:
+            writer = random.choice(writers)
+            await send_message_async(writer, f"{PROBE} {time.perf_counter()}", version=version)
+            sent += 1
+        await asyncio.sleep(1 / rate)
+    return sent
+
+
+async def measure_fan_out(
+    pid: int | None,
+    host: str,
+    port: int,
+    count: int,
+    senders: int,
+    rate: float,
+    duration: float,
+    version: int,
+) -> None:
+    clients = await connect_clients(host, port, count, version=version)
+    histogram = LatencyHistogram()
+    receivers = [
+        asyncio.create_task(receive_probes(reader, writer, version, histogram))
+        for reader, writer in clients
+    ]
+    # let the join notifications settle before measuring
+    await asyncio.sleep(1)
+    cpu_before = process_usage(pid)[1] if pid else 0
+    start = time.perf_counter()
+    sent = await send_probes([writer for _, writer in clients[:senders]], version, rate, duration)
+    # wait for messages that are still on the way
+    await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+    expected = sent * (count - 1)
+    print(f"{count} clients, {sent} messages sent at {sent / duration:.0f} messages/s")
+    print(
+        f"delivered {histogram.count} of {expected} messages, "
+        f"{histogram.count / elapsed:.0f} deliveries/s"
+    )
+    for percentile in (50, 99, 99.9):
+        print(f"p{percentile}: {histogram.percentile(percentile) * 1000:.2f} ms")
+    print(f"max: {histogram.max * 1000:.2f} ms")
+    if pid:
+        print(f"server CPU: {process_usage(pid)[1] - cpu_before:.2f} s in {elapsed:.1f} s")
+    for _, writer in clients:
+        writer.close()
+    await asyncio.gather(*receivers)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "--server",
+        default="async",
+        help=f"one of {', '.join(SERVERS)} or module:Class of another server",
+    )
+    arg_parser.add_argument(
+        "--external",
+        action="store_true",
+        help="test a server that is already running instead of starting one",
+    )
+    arg_parser.add_argument("--mode", choices=("idle", "fan-out"), default="idle")
+    arg_parser.add_argument("--clients", type=int, default=10000)
+    arg_parser.add_argument("--idle", type=float, default=5, help="seconds to stay idle")
+    arg_parser.add_argument(
+        "--senders", type=int, default=10, help="clients sending messages in fan-out mode"
+    )
+    arg_parser.add_argument("--rate", type=float, default=10, help="messages per second")
+    arg_parser.add_argument("--duration", type=float, default=10, help="seconds to send")
+    arg_parser.add_argument("--protocol", type=int, choices=(1, 2), default=1)
+    arg_parser.add_argument("--host", default="localhost")
+    arg_parser.add_argument("--port", type=int, default=8011)
+    args = arg_parser.parse_args()
+    raise_open_files_limit()
+    server = None
+    if not args.external:
+        server = multiprocessing.Process(
+            target=run_server, args=(args.server, args.host, args.port), daemon=True
+        )
+        server.start()
+    pid = server.pid if server else None
+    try:
+        wait_for_server(args.host, args.port)
+        if args.mode == "idle":
+            if pid is None:
+                arg_parser.error("the idle mode measures a server started by the test")
+            asyncio.run(measure_idle_clients(pid, args.host, args.port, args.clients, args.idle))
+        else:
+            asyncio.run(
+                measure_fan_out(
+                    pid,
+                    args.host,
+                    args.port,
+                    args.clients,
+                    args.senders,
+                    args.rate,
+                    args.duration,
+                    args.protocol,
+                )
+            )
+    finally:
+        if server:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
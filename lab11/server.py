@@ -1,81 +1,387 @@
 import socket
 import threading
+import time
+from collections import OrderedDict, deque
 
-from communication import send_message, receive_message
+from chat_log import ChatLog
+from communication import MAX_MESSAGE_SIZE, encode_frames, encode_message
+from connection import ClientConnection, SlowClientPolicy
+from timer_wheel import TimerWheel
+
+DEFAULT_ROOM = "general"
+# the size of the messages replayed in one frame by /since
+HISTORY_FRAME_SIZE = 1 << 16
+# the size of the "/history <sequence number>" line with a 20-digit number
+HISTORY_HEADER_SIZE = 30
 
 
 class ChatServer:
-    def __init__(self, host="localhost", port=8010) -> None:
+    def __init__(
+        self,
+        host="localhost",
+        port=8010,
+        max_queue_size=256,
+        slow_client_policy=SlowClientPolicy.DROP_OLDEST,
+        flush_window=0.0,
+        tcp_nodelay=True,
+        history_size=100,
+        max_empty_rooms=256,
+        log_directory=None,
+        recovery_segments=2,
+        ping_interval=30.0,
+        idle_timeout=90.0,
+    ) -> None:
         self.host = host
         self.port = port
+        self.max_queue_size = max_queue_size
+        self.slow_client_policy = slow_client_policy
+        self.flush_window = flush_window
+        self.tcp_nodelay = tcp_nodelay
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.clients = {}
+        self.rooms = {DEFAULT_ROOM: set()}
+        self.client_rooms = {}
+        self.history_size = history_size
+        self.history = {}
+        # rooms without members whose history is kept for clients coming back,
+        # the least recently emptied first
+        self.max_empty_rooms = max_empty_rooms
+        self.empty_rooms = OrderedDict()
+        self.last_sequence = 0
         self.client_lock = threading.Lock()
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.timer_wheel = TimerWheel()
+        # traffic of clients that have already left
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.chat_log = None
+        if log_directory is not None:
+            self.chat_log = ChatLog(log_directory)
+            self.recover_history(recovery_segments)
+
+    def recover_history(self, segments: int) -> None:
+        """Rebuilds room history from the last segments of the chat log."""
+        for record in self.chat_log.read_records(segments):
+            if record["room"] is not None:
+                room, sequence = record["room"], record["sequence"]
+                if room not in self.history:
+                    self.history[room] = deque(maxlen=self.history_size)
+                self.history[room].append((sequence, record["message"]))
+                self.last_sequence = max(self.last_sequence, sequence)
+        # nobody is connected yet, so rooms are kept in the order of their last message
+        for room in sorted(self.history, key=lambda room: self.history[room][-1][0]):
+            if room not in self.rooms:
+                self._keep_empty_room(room)
 
     def listen_client(self, client_name: str) -> None:
         """
-        Continuously listens for messages from a client and broadcasts it to all connected clients.
+        Continuously listens for messages from a client and broadcasts it to the clients
+        in the same room.
+
+        "/join <room>" moves the client to another room, "/leave" moves it back
+        to the default room, "/since <sequence number>" replays recent messages
+        of the room, and "/stats" shows the usage of server resources. "/ping" is
+        answered with "/pong" and "/pong" only keeps the connection alive.
         """
-        client_socket = self.clients[client_name]
+        connection = self.clients[client_name]
         try:
             while True:
-                message = receive_message(client_socket)
+                message = connection.receive_message()
                 if message == "/exit":
                     break
-                self.notify_clients(f"{client_name}: {message}", exclude=[client_name])
+                elif message == "/ping":
+                    connection.send_message("/pong")
+                elif message == "/pong":
+                    pass
+                elif message == "/stats":
+                    connection.send_message(self.format_stats())
+                elif message.startswith("/join "):
+                    self.join_room(client_name, message.removeprefix("/join ").strip())
+                elif message == "/leave":
+                    self.join_room(client_name, DEFAULT_ROOM)
+                elif message.startswith("/since "):
+                    self.send_history(client_name, message.removeprefix("/since "))
+                else:
+                    self.notify_clients(
+                        f"{client_name}: {message}",
+                        exclude={client_name},
+                        room=self.client_rooms[client_name],
+                    )
         except (ConnectionResetError, ConnectionAbortedError, ConnectionError):
             pass
         finally:
-            client_socket.close()
+            connection.close()
             with self.client_lock:
                 del self.clients[client_name]
+                self._remove_from_room(client_name)
+                self.bytes_received += connection.bytes_received
+                self.bytes_sent += connection.bytes_sent
+                self.dropped += connection.dropped
+            self.release_name(client_name)
             print(f"{client_name} has left the chat.")
             self.notify_clients(f"{client_name} has left the chat.")
 
-    def notify_clients(self, message: str, exclude: list[str] = None) -> None:
+    def join_room(self, client_name: str, room: str) -> None:
+        """Moves the client from its current room to the given one."""
+        if not room:
+            self.clients[client_name].send_message("Usage: /join <room>")
+            return
+        with self.client_lock:
+            old_room = self.client_rooms[client_name]
+            if room != old_room:
+                self._remove_from_room(client_name)
+                self.empty_rooms.pop(room, None)
+                self.rooms.setdefault(room, set()).add(client_name)
+                self.client_rooms[client_name] = room
+        self.clients[client_name].send_message(f"You are in room {room}.")
+        # rejoining the current room would only confuse its members
+        if room == old_room:
+            return
+        self.notify_clients(f"{client_name} has left room {old_room}.", room=old_room)
+        self.notify_clients(
+            f"{client_name} has joined room {room}.", exclude={client_name}, room=room
+        )
+
+    def _remove_from_room(self, client_name: str) -> str:
+        """Removes the client from its room, which must be done holding the client lock."""
+        room = self.client_rooms.pop(client_name)
+        members = self.rooms[room]
+        members.discard(client_name)
+        if not members and room != DEFAULT_ROOM:
+            del self.rooms[room]
+            if room in self.history:
+                self._keep_empty_room(room)
+        return room
+
+    def _keep_empty_room(self, room: str) -> None:
+        """
+        Keeps the history of a room without members, dropping the history of the
+        least recently emptied room when more than max_empty_rooms are kept.
+        Must be done holding the client lock.
+        """
+        self.empty_rooms[room] = None
+        self.empty_rooms.move_to_end(room)
+        if len(self.empty_rooms) > self.max_empty_rooms:
+            oldest, _ = self.empty_rooms.popitem(last=False)
+            del self.history[oldest]
+
+    def send_history(self, client_name: str, since: str) -> None:
+        """
+        Sends messages of the client's room with sequence numbers greater than since
+        in frames of at most HISTORY_FRAME_SIZE bytes, and from now on prefixes room
+        messages sent to the client with their sequence numbers.
+
+        Every frame starts with the line "/history <sequence number>" followed by
+        lines "#<sequence number> <length> <message>", where the length in characters
+        tells where a message containing newlines ends. The header holds the sequence number
+        of the last message in the frame, and the last frame the sequence number of
+        the last message of the chat, so a client disconnected in between asks only
+        for what it missed. A message longer than the maximum size of a frame can't
+        be received, so it is skipped.
+        """
+        connection = self.clients[client_name]
+        try:
+            since = int(since)
+        except ValueError:
+            connection.send_message("Usage: /since <sequence number>")
+            return
+        with self.client_lock:
+            room = self.client_rooms[client_name]
+            frames = []
+            lines = []
+            size = 0
+            for sequence, message in self.history.get(room, ()):
+                if sequence <= since:
+                    continue
+                line = f"#{sequence} {len(message)} {message}"
+                line_size = len(line.encode()) + 1
+                if line_size + HISTORY_HEADER_SIZE > MAX_MESSAGE_SIZE:
+                    continue
+                if lines and size + line_size > HISTORY_FRAME_SIZE:
+                    frames.append((previous_sequence, lines))
+                    lines = []
+                    size = 0
+                lines.append(line)
+                size += line_size
+                previous_sequence = sequence
+            frames.append((self.last_sequence, lines))
+            connection.sequenced = True
+            for sequence, lines in frames:
+                connection.send_message("\n".join([f"/history {sequence}", *lines]))
+
+    def watch_connection(self, connection: ClientConnection) -> None:
         """
-        Notifies all connected clients except those in the exclude list with the given message.
+        Pings the client after ping_interval seconds without messages from it and
+        closes the connection after idle_timeout seconds, which also stops the
+        thread reading from it.
+
+        Clients choosing a name are only timed out, so pings don't interrupt the
+        name prompt. Version 1 clients can't answer pings, so once they have a
+        name, dead peers among them are detected by TCP keepalive instead.
         """
-        exclude = exclude or []
+
+        def check() -> None:
+            if connection.closed:
+                return
+            if connection.name is not None and connection.version == 1:
+                try:
+                    connection.enable_keepalive(
+                        self.ping_interval, (self.idle_timeout - self.ping_interval) / 3, 3
+                    )
+                except OSError:
+                    # the socket was closed after the check above
+                    pass
+                return
+            idle = time.monotonic() - connection.last_received
+            if idle >= self.idle_timeout:
+                print("Closing idle connection.")
+                connection.close()
+                return
+            if connection.name is None:
+                delay = self.idle_timeout - idle
+            elif idle >= self.ping_interval:
+                connection.send_message("/ping")
+                delay = min(self.ping_interval, self.idle_timeout - idle)
+            else:
+                delay = self.ping_interval - idle
+            self.timer_wheel.schedule(delay, check)
+
+        self.timer_wheel.schedule(min(self.ping_interval, self.idle_timeout), check)
+
+    def stats(self) -> dict:
+        """Returns the usage of server resources, including clients that have left."""
         with self.client_lock:
-            for name, client_socket in self.clients.items():
+            connections = list(self.clients.values())
+            stats = {
+                "connected": len(connections),
+                "rooms": len(self.rooms),
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+                "dropped": self.dropped,
+            }
+        depths = [connection.queue_depth for connection in connections]
+        stats["queued"] = sum(depths)
+        stats["max_queue_depth"] = max(depths, default=0)
+        for connection in connections:
+            stats["bytes_received"] += connection.bytes_received
+            stats["bytes_sent"] += connection.bytes_sent
+            stats["dropped"] += connection.dropped
+        return stats
+
+    def format_stats(self) -> str:
+        return "\n".join(f"{key}: {value}" for key, value in self.stats().items())
+
+    def notify_clients(
+        self, message: str, exclude: set[str] = frozenset(), room: str | None = None
+    ) -> None:
+        """
+        Notifies connected clients except those in the exclude set with the given message.
+
+        Only members of the room are notified if it is given, otherwise all clients are.
+        Room messages get a sequence number and are kept in the bounded history of
+        the room. The message is encoded once and only queued for each client and for
+        the chat log, so slow clients and the disk don't delay the others.
+        """
+        frames = {(version, False): frame for version, frame in encode_frames(message).items()}
+        sequence = None
+        with self.client_lock:
+            if room is None:
+                names = self.clients
+            elif room not in self.rooms:
+                # the room was deleted when its last member left
+                return
+            else:
+                names = self.rooms[room]
+                self.last_sequence += 1
+                sequence = self.last_sequence
+                if room not in self.history:
+                    self.history[room] = deque(maxlen=self.history_size)
+                self.history[room].append((sequence, message))
+                sequenced_message = f"#{sequence} {message}"
+                for version, frame in encode_frames(sequenced_message).items():
+                    frames[version, True] = frame
+            if self.chat_log is not None:
+                # queued under the lock, so the log keeps the order of sequence numbers
+                self.chat_log.append(sequence, room, message)
+            for name in names:
                 if name not in exclude:
-                    send_message(client_socket, message)
+                    connection = self.clients[name]
+                    sequenced = room is not None and connection.sequenced
+                    frame = frames[connection.version, sequenced]
+                    # version 1 clients can't receive messages longer than their prefix
+                    if frame is not None:
+                        connection.send(frame)
 
     def handle_client(self, client_socket: socket.socket) -> None:
         """Handles a newly connected client."""
+        connection = ClientConnection(
+            client_socket,
+            self.max_queue_size,
+            self.slow_client_policy,
+            self.flush_window,
+            self.tcp_nodelay,
+        )
+        # clients that never send their name are closed as well
+        self.watch_connection(connection)
         try:
-            name = self.get_client_name(client_socket)
+            name = self.get_client_name(connection)
             print(f"{name} has joined the chat.")
-            self.notify_clients(f"{name} has joined the chat.", exclude=[name])
+            self.notify_clients(f"{name} has joined the chat.", exclude={name})
             threading.Thread(
                 target=self.listen_client, args=(name,), daemon=True
             ).start()
         except Exception as e:
             print(f"Error handling client: {e}")
-            client_socket.close()
+            connection.close()
 
-    def get_client_name(self, client_socket: socket.socket) -> str:
+    def get_client_name(self, connection: ClientConnection) -> str:
         """
         Gets the name of the client, adds client to the clients dictionary, and returns the name.
         """
         name_accepted = False
-        send_message(client_socket, "What is your name?")
+        # the greeting is sent before the protocol version of the client is known
+        connection.send(encode_message("What is your name?"))
         while not name_accepted:
-            name = receive_message(client_socket)
+            name = connection.receive_message()
+            # names are at the start of broadcasts, where "/" marks commands and
+            # "#<sequence number> " precedes room messages
+            if name.startswith(("/", "#")):
+                connection.send_message(
+                    'Names can\'t start with "/" or "#". Please choose another name.'
+                )
+                continue
+            if any(char.isspace() for char in name):
+                connection.send_message("Names can't contain spaces. Please choose another name.")
+                continue
+            if not self.reserve_name(name):
+                connection.send_message("Name already taken. Please choose another name.")
+                continue
             with self.client_lock:
                 if name in self.clients:
-                    send_message(
-                        client_socket,
-                        "Name already taken. Please choose another name.",
-                    )
+                    connection.send_message("Name already taken. Please choose another name.")
                 else:
-                    self.clients[name] = client_socket
+                    self.clients[name] = connection
+                    self.rooms[DEFAULT_ROOM].add(name)
+                    self.client_rooms[name] = DEFAULT_ROOM
+                    connection.name = name
                     name_accepted = True
-                    send_message(client_socket, "Welcome to the chat!")
+                    connection.send_message("Welcome to the chat!")
         return name
 
+    def reserve_name(self, name: str) -> bool:
+        """
+        Reserves the name outside of this server before it is added to the clients dictionary.
+
+        A single server has nothing to reserve, since it checks its own clients.
+        """
+        return True
+
+    def release_name(self, name: str) -> None:
+        """Releases the name reserved with reserve_name after the client has left."""
+
     def run_server(self) -> None:
         """ Runs the chat server, accepts clients, and handles them."""
         try:
@@ -90,6 +396,9 @@ class ChatServer:
                 ).start()
         finally:
             self.server_socket.close()
+            self.timer_wheel.stop()
+            if self.chat_log is not None:
+                self.chat_log.close()
 
 
 if __name__ == "__main__":
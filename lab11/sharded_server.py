@@ -0,0 +1,234 @@
+"""
+Chat server that runs several worker processes sharing one listening port.
+
+Every worker is a ChatServer bound with SO_REUSEPORT, so the kernel spreads new
+connections between them. Workers are connected to a backplane hub over a Unix
+domain socket. The hub reserves client names for the whole chat and relays each
+broadcast to the other workers. Messages between workers and the hub are JSON
+objects sent in version 2 frames.
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+
+from communication import MessageReader, send_message
+from server import ChatServer
+
+
+class Backplane:
+    """Hub that owns the names of all clients and relays broadcasts between workers."""
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self.names = {}
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def handle_worker(self, worker_socket: socket.socket) -> None:
+        """Serves requests of a single worker until it disconnects."""
+        reader = MessageReader(worker_socket, version=2)
+        send_lock = threading.Lock()
+        with self.lock:
+            self.workers[worker_socket] = send_lock
+        try:
+            while True:
+                request = json.loads(reader.receive())
+                if request["type"] == "reserve":
+                    with self.lock:
+                        reserved = request["name"] not in self.names
+                        if reserved:
+                            self.names[request["name"]] = worker_socket
+                    reply = {"type": "reserved", "id": request["id"], "reserved": reserved}
+                    with send_lock:
+                        send_message(worker_socket, json.dumps(reply), version=2)
+                elif request["type"] == "release":
+                    with self.lock:
+                        if self.names.get(request["name"]) is worker_socket:
+                            del self.names[request["name"]]
+                elif request["type"] == "broadcast":
+                    self.relay(worker_socket, json.dumps(request))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.lock:
+                del self.workers[worker_socket]
+                for name, owner in list(self.names.items()):
+                    if owner is worker_socket:
+                        del self.names[name]
+            worker_socket.close()
+
+    def relay(self, sender: socket.socket, data: str) -> None:
+        """Sends the broadcast to every worker except the one it came from."""
+        with self.lock:
+            workers = [item for item in self.workers.items() if item[0] is not sender]
+        for worker_socket, send_lock in workers:
+            try:
+                with send_lock:
+                    send_message(worker_socket, data, version=2)
+            except OSError:
+                pass
+
+    def bind(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server_socket.bind(self.socket_path)
+        self.server_socket.listen()
+
+    def serve(self) -> None:
+        """Accepts workers and handles each of them in its own thread."""
+        while True:
+            worker_socket, _ = self.server_socket.accept()
+            threading.Thread(
+                target=self.handle_worker, args=(worker_socket,), daemon=True
+            ).start()
+
+
+class BackplaneClient:
+    """Connection of a worker to the backplane hub."""
+
+    def __init__(
+        self,
+        socket_path: str,
+        on_broadcast: callable,
+        on_disconnect: callable,
+        timeout: float = 5,
+    ) -> None:
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.reader = MessageReader(self.socket, version=2)
+        self.on_broadcast = on_broadcast
+        self.on_disconnect = on_disconnect
+        self.timeout = timeout
+        self.send_lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.pending = {}
+        threading.Thread(target=self.read_messages, daemon=True).start()
+
+    def send(self, request: dict) -> None:
+        with self.send_lock:
+            send_message(self.socket, json.dumps(request), version=2)
+
+    def reserve(self, name: str) -> bool:
+        """Reserves the name for the whole chat, returns False if it is taken."""
+        request_id = next(self.request_ids)
+        event = threading.Event()
+        self.pending[request_id] = [event, False]
+        self.send({"type": "reserve", "id": request_id, "name": name})
+        if not event.wait(self.timeout):
+            raise ConnectionError("Backplane didn't answer")
+        return self.pending.pop(request_id)[1]
+
+    def release(self, name: str) -> None:
+        self.send({"type": "release", "name": name})
+
+    def publish(self, message: str, exclude: set[str], room: str | None) -> None:
+        self.send(
+            {"type": "broadcast", "message": message, "exclude": list(exclude), "room": room}
+        )
+
+    def read_messages(self) -> None:
+        """Dispatches replies to reservations and broadcasts from other workers."""
+        try:
+            while True:
+                message = json.loads(self.reader.receive())
+                if message["type"] == "reserved":
+                    result = self.pending[message["id"]]
+                    result[1] = message["reserved"]
+                    result[0].set()
+                elif message["type"] == "broadcast":
+                    self.on_broadcast(
+                        message["message"], set(message["exclude"]), message["room"]
+                    )
+        except ConnectionError:
+            self.on_disconnect()
+
+
+class ShardedChatServer(ChatServer):
+    """ChatServer worker that shares its port and its clients' names with other workers."""
+
+    def __init__(self, backplane_path: str, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.backplane_path = backplane_path
+        self.backplane = None
+
+    def reserve_name(self, name: str) -> bool:
+        return self.backplane.reserve(name)
+
+    def release_name(self, name: str) -> None:
+        self.backplane.release(name)
+
+    def notify_clients(
+        self, message: str, exclude: set[str] = frozenset(), room: str | None = None
+    ) -> None:
+        """Notifies clients of this worker and publishes the message to other workers."""
+        super().notify_clients(message, exclude, room)
+        self.backplane.publish(message, exclude, room)
+
+    def notify_local_clients(self, message: str, exclude: set[str], room: str | None) -> None:
+        """Notifies clients of this worker about a broadcast from another worker."""
+        super().notify_clients(message, exclude, room)
+
+    def send_history(self, client_name: str, since: str) -> None:
+        """
+        Sends an empty history, since every worker numbers room messages on its own
+        and a reconnecting client is usually accepted by another worker, where its
+        sequence number would select the wrong messages.
+        """
+        self.clients[client_name].send_message("/history 0")
+
+    def stop(self) -> None:
+        """Stops the worker, since names can't be kept unique without the backplane."""
+        print("Connection to backplane lost.")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def run_server(self) -> None:
+        self.backplane = BackplaneClient(
+            self.backplane_path, self.notify_local_clients, self.stop
+        )
+        super().run_server()
+
+
+def run_worker(backplane_path: str, host: str, port: int) -> None:
+    ShardedChatServer(backplane_path, host=host, port=port).run_server()
+
+
+def run_sharded_server(host="localhost", port=8010, workers=None) -> None:
+    """Runs the backplane hub in this process and the given number of worker processes."""
+    workers = workers or os.cpu_count() or 1
+    # run the cleanup below when terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    backplane_path = os.path.join(tempfile.mkdtemp(), "backplane.sock")
+    backplane = Backplane(backplane_path)
+    backplane.bind()
+    threading.Thread(target=backplane.serve, daemon=True).start()
+    processes = [
+        multiprocessing.Process(
+            target=run_worker, args=(backplane_path, host, port), daemon=True
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        os.unlink(backplane_path)
+        os.rmdir(os.path.dirname(backplane_path))
+
+
+if __name__ == "__main__":
+    run_sharded_server(host="localhost", port=8010)
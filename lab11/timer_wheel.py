@@ -0,0 +1,80 @@
+"""Module for a hashed timer wheel that runs many coarse timers with a single thread."""
+
+import threading
+import time
+import traceback
+
+
+class Timer:
+    """A callback scheduled on a TimerWheel."""
+
+    def __init__(self, callback: callable, rounds: int) -> None:
+        self.callback = callback
+        # the number of full turns of the wheel left before the timer expires
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Timers hashed into slots of a wheel that advances by one slot every tick.
+
+    Scheduling and cancelling a timer takes constant time, and every tick only
+    looks at the timers of one slot, so thousands of idle timeouts cost almost
+    nothing. Timers expire up to one tick late. Callbacks run in the thread of
+    the wheel, so they should not block. An exception of a callback is printed
+    and doesn't stop the other timers.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64) -> None:
+        """
+        :param tick: the resolution of the timers in seconds
+        :param slots: the number of slots of the wheel
+        """
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def schedule(self, delay: float, callback: callable) -> Timer:
+        """
+        Schedules the callback to be called after the delay.
+
+        :param delay: the delay in seconds
+        :param callback: the function to call without arguments
+        :return: the timer that can be cancelled
+        """
+        ticks = max(1, round(delay / self.tick))
+        with self.lock:
+            timer = Timer(callback, (ticks - 1) // len(self.slots))
+            self.slots[(self.current + ticks) % len(self.slots)].append(timer)
+        return timer
+
+    def advance(self) -> None:
+        """Moves to the next slot and runs its expired timers."""
+        with self.lock:
+            self.current = (self.current + 1) % len(self.slots)
+            slot = self.slots[self.current]
+            expired = [timer for timer in slot if timer.rounds == 0 and not timer.cancelled]
+            slot[:] = [timer for timer in slot if timer.rounds > 0 and not timer.cancelled]
+            for timer in slot:
+                timer.rounds -= 1
+        for timer in expired:
+            try:
+                timer.callback()
+            except Exception:
+                traceback.print_exc()
+
+    def run(self) -> None:
+        next_tick = time.monotonic() + self.tick
+        while not self.stopped.wait(max(0.0, next_tick - time.monotonic())):
+            self.advance()
+            next_tick += self.tick
+
+    def stop(self) -> None:
+        self.stopped.set()
@@ -0,0 +1,134 @@
+"""
+Benchmark of requests per second served by server.py with different numbers of
+workers.
+
+The server is started for every configuration and loaded by client processes
+that send requests over keep-alive connections, so the clients aren't limited by
+the GIL of a single process.
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+def wait_for_server(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def send_requests(port: int, path: str, connections: int, duration: float) -> int:
+    """
+    Sends requests over the given number of connections until the duration ends.
+
+    :return: the number of successful requests
+    """
+    counts = [0] * connections
+
+    def run(index: int) -> None:
+        deadline = time.monotonic() + duration
+        connection = http.client.HTTPConnection("localhost", port, timeout=10)
+        while time.monotonic() < deadline:
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[index] += 1
+            except (OSError, http.client.HTTPException):
+                # wsgiref closes the connection after every request
+                connection.close()
+        connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+def benchmark(
+    server: str,
+    port: int,
+    threads: int,
+    processes: int,
+    path: str,
+    clients: int,
+    connections: int,
+    duration: float,
+) -> float:
+    """
+    Starts the server with the given workers and measures its requests per second.
+
+    :param threads: the number of threads per server process, 0 for wsgiref
+    :param clients: the number of client processes
+    :param connections: the number of connections of every client process
+    """
+    command = [sys.executable, server, "--port", str(port), "--quiet"]
+    command += ["--threads", str(threads), "--processes", str(processes)]
+    process = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(server),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_server(port)
+        with multiprocessing.Pool(clients) as pool:
+            start = time.monotonic()
+            counts = pool.starmap(
+                send_requests, [(port, path, connections, duration)] * clients
+            )
+            elapsed = time.monotonic() - start
+        return sum(counts) / elapsed
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--server", default=SERVER, help="server.py of lab12 or lab13")
+    arg_parser.add_argument("--port", type=int, default=8012)
+    arg_parser.add_argument("--path", default="/")
+    arg_parser.add_argument("--threads", type=int, default=8, help="threads per process")
+    arg_parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    arg_parser.add_argument("--clients", type=int, default=4, help="client processes")
+    arg_parser.add_argument("--connections", type=int, default=8, help="per client process")
+    arg_parser.add_argument("--duration", type=float, default=5)
+    args = arg_parser.parse_args()
+    server = os.path.abspath(args.server)
+    configurations = [(0, 1)] + [(args.threads, processes) for processes in args.processes]
+    for threads, processes in configurations:
+        requests_per_second = benchmark(
+            server,
+            args.port,
+            threads,
+            processes,
+            args.path,
+            args.clients,
+            args.connections,
+            args.duration,
+        )
+        name = "wsgiref" if threads == 0 else f"{processes} x {threads} threads"
+        print(f"{name}: {requests_per_second:.0f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,120 @@
 from wsgiref.simple_server import make_server
-from jinja2 import Environment, FileSystemLoader
+from concurrent_server import serve
+from email.utils import formatdate, parsedate_to_datetime
+from jinja2 import Environment, FileSystemLoader, meta
+import argparse
+import hashlib
 import os
+import time
 
 template_dir = os.path.join(os.path.dirname(__file__), 'templates')
 env = Environment(loader=FileSystemLoader(template_dir))
 
+# routes rendered without context, so their pages can be cached
+STATIC_ROUTES = {'': 'index.html', 'info': 'info.html'}
+# how often in seconds the templates of a cached page are checked for changes
+CHECK_INTERVAL = 1.0
+page_cache = {}
+
+
+def template_files(name):
+    """Returns paths of the template and of all templates it extends or includes."""
+    files = []
+    names = [name]
+    while names:
+        name = names.pop()
+        source, path, _ = env.loader.get_source(env, name)
+        files.append(path)
+        names.extend(meta.find_referenced_templates(env.parse(source)))
+    return files
+
+
+def templates_mtime(files):
+    return max(os.stat(path).st_mtime for path in files)
+
+
+def render_page(name):
+    """Renders the template and returns the cache entry with the encoded page."""
+    files = template_files(name)
+    mtime = templates_mtime(files)
+    body = env.get_template(name).render().encode('utf-8')
+    return {
+        'body': body,
+        'files': files,
+        'mtime': mtime,
+        'checked': time.monotonic(),
+        'etag': '"' + hashlib.sha1(body).hexdigest() + '"',
+        'last_modified': formatdate(int(mtime), usegmt=True),
+    }
+
+
+def get_page(name):
+    """Returns the cached page, rendering it again if its templates have changed."""
+    page = page_cache.get(name)
+    if page is not None and time.monotonic() - page['checked'] >= CHECK_INTERVAL:
+        try:
+            changed = templates_mtime(page['files']) != page['mtime']
+        except OSError:
+            changed = True
+        if changed:
+            page = None
+        else:
+            page['checked'] = time.monotonic()
+    if page is None:
+        page = page_cache[name] = render_page(name)
+    return page
+
+
+def is_not_modified(environ, page):
+    """Checks the conditional headers of the request against the cached page."""
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = [etag.strip() for etag in if_none_match.split(',')]
+        return '*' in etags or page['etag'] in etags or 'W/' + page['etag'] in etags
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(page['mtime']) <= since
+    return False
+
 
 def application(environ, start_response):
     path = environ.get('PATH_INFO', '').lstrip('/')
-    status = '200 OK'
-    headers = [('Content-Type', 'text/html; charset=utf-8')]
-    if path == '':
-        template = env.get_template('index.html')
-        response = template.render()
-    elif path == 'info':
-        template = env.get_template('info.html')
-        response = template.render()
-    else:
-        status = '404 Not Found'
-        response = '404 Not Found'
-    response = response.encode('utf-8')
-    start_response(status, headers)
+    if path in STATIC_ROUTES:
+        page = get_page(STATIC_ROUTES[path])
+        headers = [
+            ('ETag', page['etag']),
+            ('Last-Modified', page['last_modified']),
+            ('Cache-Control', 'no-cache'),
+        ]
+        if is_not_modified(environ, page):
+            start_response('304 Not Modified', headers)
+            return []
+        headers.append(('Content-Type', 'text/html; charset=utf-8'))
+        headers.append(('Content-Length', str(len(page['body']))))
+        start_response('200 OK', headers)
+        return [page['body']]
+    response = '404 Not Found'.encode('utf-8')
+    start_response('404 Not Found', [('Content-Type', 'text/html; charset=utf-8')])
     return [response]
 
 if __name__ == '__main__':
-    port = 8000
-    with make_server('', 8000, application) as httpd:
-        print(f'Server started on localhost:{port}')
-        httpd.serve_forever()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--port', type=int, default=8000)
+    arg_parser.add_argument(
+        '--threads', type=int, default=0,
+        help='serve concurrently with this many threads per process instead of wsgiref',
+    )
+    arg_parser.add_argument('--processes', type=int, default=1)
+    arg_parser.add_argument('--backlog', type=int, default=128)
+    arg_parser.add_argument('--quiet', action='store_true', help="don't log requests")
+    args = arg_parser.parse_args()
+    if args.threads:
+        serve(application, '', args.port, args.threads, args.processes, args.backlog, args.quiet)
+    else:
+        with make_server('', args.port, application) as httpd:
+            print(f'Server started on localhost:{args.port}')
+            httpd.serve_forever()
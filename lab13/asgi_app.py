@@ -0,0 +1,120 @@
+"""
+ASGI version of the application in server.py.
+
+Request bodies are read from the event loop, so a slow client only holds a small
+buffer instead of a worker thread. Run it with any ASGI server, for example:
+
+    uvicorn asgi_app:app --port 8000
+"""
+
+import asyncio
+from jinja2 import Environment, FileSystemLoader
+
+from server import (
+    MAX_BODY_SIZE,
+    FormError,
+    db,
+    parse_form,
+    template_dir,
+    validate_form,
+)
+
+env = Environment(loader=FileSystemLoader(template_dir), enable_async=True)
+index_template = env.get_template("index.html")
+info_template = env.get_template("info.html")
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(scope: dict, receive: callable) -> bytes:
+    """
+    Read the request body chunk by chunk, stopping as soon as it is too large
+
+    :raises BodyTooLarge: if the body is larger than MAX_BODY_SIZE
+    :raises ConnectionError: if the client disconnected
+    """
+    for name, value in scope["headers"]:
+        if name == b"content-length" and int(value) > MAX_BODY_SIZE:
+            raise BodyTooLarge
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_SIZE:
+            raise BodyTooLarge
+        if not message.get("more_body", False):
+            return bytes(body)
+
+
+async def process_form(scope: dict, receive: callable) -> tuple[str, str]:
+    """Process the form data and return the status and the response"""
+    try:
+        form = parse_form(await read_body(scope, receive))
+    except BodyTooLarge:
+        return "413 Content Too Large", "413 Content Too Large"
+    except ValueError:
+        return "400 Bad Request", "400 Bad Request"
+    # the email is looked up in the database, so it is validated in a thread
+    errors, submitted_data = await asyncio.to_thread(validate_form, form)
+    # the insert waits for a commit, so it runs in a thread to keep the loop serving
+    if not errors and not await asyncio.to_thread(db.add, submitted_data):
+        errors.append(FormError("email", "Email already exists"))
+    if not errors:
+        response = await info_template.render_async(
+            submitted_data=submitted_data, success=True
+        )
+    else:
+        response = await info_template.render_async(errors=errors)
+    return "200 OK", response
+
+
+async def send_response(send: callable, status: str, response: str) -> None:
+    body = response.encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": int(status.split()[0]),
+            "headers": [
+                (b"content-type", b"text/html; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive: callable, send: callable) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive: callable, send: callable) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    path = scope["path"].lstrip("/")
+    method = scope["method"]
+    status = "200 OK"
+    if path == "":
+        response = await index_template.render_async()
+    elif path == "info":
+        if method == "POST":
+            try:
+                status, response = await process_form(scope, receive)
+            except ConnectionError:
+                return
+        else:
+            response = await info_template.render_async()
+    else:
+        status = "404 Not Found"
+        response = "404 Not Found"
+    await send_response(send, status, response)
@@ -0,0 +1,265 @@
+"""
+WSGI server that handles requests concurrently with a pool of threads in one or
+more preforked processes.
+
+Connections are kept alive as HTTP/1.1 requires, so a client can send many
+requests over one connection. A connection occupies its thread while it waits for
+the next request, so idle connections are closed after KEEP_ALIVE_TIMEOUT seconds.
+
+The labs don't import from each other, so the same module is kept in
+lab12/concurrent_server.py; a fix in one copy has to be made in the other as well.
+"""
+
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+KEEP_ALIVE_TIMEOUT = 5
+# statuses that never have a body, so they don't need a length to keep the connection
+BODYLESS_STATUSES = ("204", "304")
+# the most of an unread request body that is skipped to keep the connection,
+# a larger body is left unread and the connection is closed instead
+MAX_SKIPPED_BODY = 64 * 1024
+
+
+class RequestBody:
+    """
+    The wsgi.input stream limited to the body of the current request.
+
+    The part of the body the application did not read is skipped after the
+    response, so it isn't taken for the next request on the connection.
+    """
+
+    def __init__(self, stream, length: int) -> None:
+        self.stream = stream
+        self.remaining = length
+
+    def _limit(self, size: int) -> int:
+        return self.remaining if size is None or size < 0 else min(size, self.remaining)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(self._limit(size))
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        data = self.stream.readline(self._limit(size))
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint: int = -1) -> list[bytes]:
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def skip(self) -> None:
+        while self.remaining and self.read(1 << 16):
+            pass
+
+
+class KeepAliveServerHandler(ServerHandler):
+    """ServerHandler that answers with HTTP/1.1 and tells the client whether to reconnect."""
+
+    http_version = "1.1"
+
+    def write(self, data: bytes) -> None:
+        """Writes the data, or for HEAD requests only the headers."""
+        if self.environ["REQUEST_METHOD"] != "HEAD":
+            super().write(data)
+        elif not self.headers_sent:
+            # the Content-Length of a single block body is still sent, as for GET
+            self.bytes_sent = len(data)
+            self.send_headers()
+
+    def cleanup_headers(self) -> None:
+        super().cleanup_headers()
+        request_handler = self.request_handler
+        # without a length the client can only find the end of the body when the
+        # connection is closed
+        if "Content-Length" not in self.headers and not self.status.startswith(
+            BODYLESS_STATUSES
+        ):
+            request_handler.close_connection = True
+        # skipping a large unread body would keep the thread busy
+        if isinstance(self.stdin, RequestBody) and self.stdin.remaining > MAX_SKIPPED_BODY:
+            request_handler.close_connection = True
+        if request_handler.close_connection:
+            self.headers["Connection"] = "close"
+        elif request_handler.request_version == "HTTP/1.0":
+            self.headers["Connection"] = "keep-alive"
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """WSGIRequestHandler that serves requests until the connection is closed."""
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+    # the status line, headers and body are written separately, so they are buffered
+    # and flushed together, and Nagle's algorithm doesn't delay the next response
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def handle(self) -> None:
+        # the handle of BaseHTTPRequestHandler, which wsgiref replaces to serve
+        # a single request
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self) -> None:
+        """Serves a single request, the same way WSGIRequestHandler.handle does."""
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (TimeoutError, ConnectionError):
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            # the length of the body is unknown, so the connection can't be reused
+            self.close_connection = True
+            body = self.rfile
+        else:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # send_error closes the connection
+                self.send_error(400, "Invalid Content-Length")
+                return
+            body = RequestBody(self.rfile, length)
+        # the handler passes its stdin to the application as wsgi.input
+        handler = KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ(), multithread=True
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+        self.wfile.flush()
+        if not self.close_connection:
+            if body.remaining > MAX_SKIPPED_BODY:
+                self.close_connection = True
+            else:
+                body.skip()
+
+    def log_message(self, format: str, *args) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """
+    WSGIServer that handles connections with a fixed pool of threads.
+
+    Accepted connections wait in a queue of at most backlog connections. When it
+    is full the server stops accepting, so further connections wait in the listen
+    backlog of the same size and are then refused by the kernel.
+    """
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        threads: int = 8,
+        backlog: int = 128,
+        quiet: bool = False,
+    ) -> None:
+        # used by server_activate to listen
+        self.request_queue_size = backlog
+        self.threads = threads
+        self.quiet = quiet
+        super().__init__(server_address, KeepAliveRequestHandler)
+        self.requests = queue.Queue(backlog)
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        # the threads are started here, since a forked process only keeps the
+        # thread that forked it
+        for _ in range(self.threads):
+            threading.Thread(target=self.process_requests, daemon=True).start()
+        super().serve_forever(poll_interval)
+
+    def process_request(self, request: socket.socket, client_address) -> None:
+        self.requests.put((request, client_address))
+
+    def process_requests(self) -> None:
+        """Handles queued connections in a thread of the pool."""
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+def serve(
+    application: callable,
+    host: str = "",
+    port: int = 8000,
+    threads: int = 8,
+    processes: int = 1,
+    backlog: int = 128,
+    quiet: bool = False,
+) -> None:
+    """
+    Serves the WSGI application until interrupted.
+
+    With several processes the listening socket is opened before forking, so
+    the processes accept connections from the same backlog. The processes don't
+    share memory, so state of the application is not shared between them.
+
+    :param application: the WSGI application
+    :param host: the host to listen on
+    :param port: the port to listen on
+    :param threads: the number of threads handling connections in each process
+    :param processes: the number of worker processes
+    :param backlog: the maximum number of connections waiting for a thread
+    :param quiet: whether to stop logging requests
+    """
+    httpd = ThreadPoolWSGIServer((host, port), threads, backlog, quiet)
+    httpd.set_app(application)
+    print(f"Server started on localhost:{port} with {processes} x {threads} workers")
+    if processes == 1:
+        with httpd:
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            httpd.serve_forever()
+            os._exit(0)
+        children.append(pid)
+    # stop the workers too when the parent is terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        httpd.server_close()
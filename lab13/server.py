@@ -1,49 +1,104 @@
+import argparse
 import re
 from wsgiref.simple_server import make_server
+from concurrent_server import serve
+from storage import RegistrationStore
 from jinja2 import Environment, FileSystemLoader
 import os
-from urllib.parse import parse_qs
+from typing import NamedTuple
+from urllib.parse import unquote_to_bytes
 
 template_dir = os.path.join(os.path.dirname(__file__), "templates")
 env = Environment(loader=FileSystemLoader(template_dir))
-db = {}
+# templates are loaded and compiled once instead of on every request
+index_template = env.get_template("index.html")
+info_template = env.get_template("info.html")
+db = RegistrationStore(os.path.join(os.path.dirname(__file__), "registrations.db"))
 
+# names of the expected form fields in the raw body
+FORM_FIELDS = {b"name": "name", b"email": "email", b"age": "age"}
+MAX_BODY_SIZE = 64 * 1024
+# the longest email address allowed by RFC 5321
+MAX_EMAIL_LENGTH = 254
+EMAIL_PATTERN = re.compile(r"^((?!\.)[\w\-_.]*[^.])(@\w+)(\.\w+(\.\w+)?[^.\W])$")
 
-def process_form(environ: dict) -> str:
-    """Process the form data and return the response"""
-    content_length = int(environ.get("CONTENT_LENGTH", 0))
-    post_data = parse_qs(environ["wsgi.input"].read(content_length).decode("utf-8"))
-    name = post_data.get("name", "")[0].strip()
-    email = post_data.get("email", "")[0].strip()
-    age = post_data.get("age", "")[0].strip()
+
+class FormError(NamedTuple):
+    """A validation error of a form field, rendered as its message"""
+
+    field: str
+    message: str
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def parse_form(body: bytes) -> dict[str, str]:
+    """
+    Parse the URL-encoded form body in a single pass over the raw bytes
+
+    Only the first value of each of FORM_FIELDS is decoded, other fields are skipped.
+    Missing fields are returned as empty strings.
+    """
+    form = {}
+    for pair in body.split(b"&"):
+        key, _, value = pair.partition(b"=")
+        field = FORM_FIELDS.get(key)
+        if field is not None and field not in form:
+            form[field] = unquote_to_bytes(value.replace(b"+", b" ")).decode("utf-8", "replace")
+    return {field: form.get(field, "") for field in FORM_FIELDS.values()}
+
+
+def validate_form(form: dict[str, str]) -> tuple[list[FormError], dict]:
+    """Validate the parsed form data and return the errors and the submitted data"""
+    name = form["name"].strip()
+    email = form["email"].strip()
+    age = form["age"].strip()
     errors = []
     if email in db:
-        errors.append("Email already exists")
+        errors.append(FormError("email", "Email already exists"))
     if not name:
-        errors.append("Name is required")
+        errors.append(FormError("name", "Name is required"))
     if not email:
-        errors.append("Email is required")
+        errors.append(FormError("email", "Email is required"))
     if not age:
-        errors.append("Age is required")
-    if not re.match(r"^((?!\.)[\w\-_.]*[^.])(@\w+)(\.\w+(\.\w+)?[^.\W])$", email):
-        errors.append("Invalid email")
+        errors.append(FormError("age", "Age is required"))
+    # the length is checked first, so the regex never backtracks over a long input
+    if len(email) > MAX_EMAIL_LENGTH or not EMAIL_PATTERN.match(email):
+        errors.append(FormError("email", "Invalid email"))
     try:
         age = int(age)
         if age < 0:
-            errors.append("Age must be a positive number")
+            errors.append(FormError("age", "Age must be a positive number"))
         elif age > 150:
-            errors.append("You can't be that old!")
+            errors.append(FormError("age", "You can't be that old!"))
+    except ValueError:
+        errors.append(FormError("age", "Age must be a number"))
+    return errors, {"name": name, "email": email, "age": age}
+
+
+def process_form(environ: dict) -> tuple[str, str]:
+    """Process the form data and return the status and the response"""
+    try:
+        content_length = int(environ.get("CONTENT_LENGTH") or 0)
     except ValueError:
-        errors.append("Age must be a number")
+        return "400 Bad Request", "400 Bad Request"
+    # read(-1) would read the stream to its end
+    if content_length < 0:
+        return "400 Bad Request", "400 Bad Request"
+    # rejected before reading, so an oversized body is never buffered
+    if content_length > MAX_BODY_SIZE:
+        return "413 Content Too Large", "413 Content Too Large"
+    form = parse_form(environ["wsgi.input"].read(content_length))
+    errors, submitted_data = validate_form(form)
+    # the email may have been registered by another request since the check
+    if not errors and not db.add(submitted_data):
+        errors.append(FormError("email", "Email already exists"))
     if not errors:
-        template = env.get_template("info.html")
-        submitted_data = {"name": name, "email": email, "age": age}
-        db[email] = submitted_data
-        response = template.render(submitted_data=submitted_data, success=True)
+        response = info_template.render(submitted_data=submitted_data, success=True)
     else:
-        template = env.get_template("info.html")
-        response = template.render(errors=errors)
-    return response
+        response = info_template.render(errors=errors)
+    return "200 OK", response
 
 
 def application(environ: dict, start_response: callable):
@@ -52,14 +107,12 @@ def application(environ: dict, start_response: callable):
     status = "200 OK"
     headers = [("Content-Type", "text/html; charset=utf-8")]
     if path == "":
-        template = env.get_template("index.html")
-        response = template.render()
+        response = index_template.render()
     elif path == "info":
         if method == "POST":
-            response = process_form(environ)
+            status, response = process_form(environ)
         else:
-            template = env.get_template("info.html")
-            response = template.render()
+            response = info_template.render()
     else:
         status = "404 Not Found"
         response = "404 Not Found"
@@ -69,7 +122,21 @@ def application(environ: dict, start_response: callable):
 
 
 if __name__ == "__main__":
-    port = 8000
-    with make_server("", 8000, application) as httpd:
-        print(f"Server started on localhost:{port}")
-        httpd.serve_forever()
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="serve concurrently with this many threads per process instead of wsgiref",
+    )
+    arg_parser.add_argument("--processes", type=int, default=1)
+    arg_parser.add_argument("--backlog", type=int, default=128)
+    arg_parser.add_argument("--quiet", action="store_true", help="don't log requests")
+    args = arg_parser.parse_args()
+    if args.threads:
+        serve(application, "", args.port, args.threads, args.processes, args.backlog, args.quiet)
+    else:
+        with make_server("", args.port, application) as httpd:
+            print(f"Server started on localhost:{args.port}")
+            httpd.serve_forever()
@@ -0,0 +1,158 @@
+"""Module for the persistent store of registrations backed by SQLite."""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    email TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    age INTEGER NOT NULL
+)
+"""
+
+
+class PendingInsert:
+    """A registration waiting for the writer to commit it."""
+
+    def __init__(self, data: dict) -> None:
+        self.data = data
+        self.inserted = False
+        self.error = None
+        self.done = threading.Event()
+
+
+class RegistrationStore:
+    """
+    Registrations stored in SQLite in WAL mode, so reads don't wait for writes.
+
+    The primary key on email makes checking and inserting a single atomic
+    statement. Inserts from all threads are handed to one writer thread, which
+    commits everything that is waiting in one transaction, so under load many
+    registrations share a single sync of the log. Reads use a small pool of
+    connections. Connections and the writer are created on first use in each
+    process, so the store works in forked worker processes as well.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4, batch_size: int = 256) -> None:
+        """
+        :param path: the path to the database file
+        :param pool_size: the number of connections for reads
+        :param batch_size: the maximum number of inserts committed together
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.pid = None
+        self.start_lock = threading.Lock()
+        connection = self.connect()
+        with connection:
+            connection.execute(SCHEMA)
+        connection.close()
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # commits stay atomic, only the last ones may be lost on a power failure
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    def _start(self) -> None:
+        """Opens the connections and starts the writer in the current process."""
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.pool = queue.Queue()
+            for _ in range(self.pool_size):
+                self.pool.put(self.connect())
+            self.inserts = queue.Queue()
+            threading.Thread(target=self.write_inserts, daemon=True).start()
+            self.pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection from the pool."""
+        if self.pid != os.getpid():
+            self._start()
+        connection = self.pool.get()
+        try:
+            yield connection
+        finally:
+            self.pool.put(connection)
+
+    def __contains__(self, email: str) -> bool:
+        with self.connection() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM registrations WHERE email = ?", (email,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, email: str) -> dict | None:
+        with self.connection() as connection:
+            row = connection.execute(
+                "SELECT name, email, age FROM registrations WHERE email = ?", (email,)
+            ).fetchone()
+        return None if row is None else {"name": row[0], "email": row[1], "age": row[2]}
+
+    def __len__(self) -> int:
+        with self.connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM registrations").fetchone()[0]
+
+    def add(self, data: dict) -> bool:
+        """
+        Inserts the registration unless its email is already registered.
+
+        :param data: the registration with name, email and age
+        :return: whether the registration was inserted
+        :raises sqlite3.Error: if the registration could not be stored
+        """
+        if self.pid != os.getpid():
+            self._start()
+        pending = PendingInsert(data)
+        self.inserts.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.inserted
+
+    def write_inserts(self) -> None:
+        """Commits waiting inserts in batches until the process exits."""
+        connection = self.connect()
+        while True:
+            batch = [self.inserts.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.inserts.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with connection:
+                    # begun explicitly, so releasing a savepoint doesn't commit
+                    connection.execute("BEGIN")
+                    for pending in batch:
+                        self.insert(connection, pending)
+            except sqlite3.Error as e:
+                for pending in batch:
+                    pending.inserted = False
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+    def insert(self, connection: sqlite3.Connection, pending: PendingInsert) -> None:
+        """Inserts one registration of a batch, undoing only it if it fails."""
+        connection.execute("SAVEPOINT registration")
+        try:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO registrations (email, name, age) "
+                "VALUES (:email, :name, :age)",
+                pending.data,
+            )
+            pending.inserted = cursor.rowcount == 1
+        except sqlite3.Error as e:
+            connection.execute("ROLLBACK TO registration")
+            pending.error = e
+        connection.execute("RELEASE registration")
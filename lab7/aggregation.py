@@ -0,0 +1,169 @@
+"""Module for aggregating nginx log entries in the combined format by several fields."""
+
+import heapq
+from collections import Counter
+from collections.abc import Iterable
+
+from main import extract_bytes_raw, iter_lines, malformed_entry_error, open_log
+
+
+def extract_ip(entry: bytes) -> bytes:
+    """Extract the client IP address from the given entry"""
+    return entry[: entry.index(b" ")]
+
+
+def extract_time(entry: bytes) -> bytes:
+    """Extract the local time, e.g. 07/May/2017:08:15:31 +0300, from the given entry"""
+    start = entry.index(b"[") + 1
+    return entry[start : entry.index(b"]", start)]
+
+
+def extract_minute(entry: bytes) -> bytes:
+    """Extract the time truncated to minutes, e.g. 07/May/2017:08:15"""
+    return extract_time(entry)[:17]
+
+
+def extract_hour(entry: bytes) -> bytes:
+    """Extract the time truncated to hours, e.g. 07/May/2017:08"""
+    return extract_time(entry)[:14]
+
+
+def extract_request(entry: bytes) -> bytes:
+    """Extract the request line, e.g. GET / HTTP/1.0, from the given entry"""
+    start = entry.index(b'"') + 1
+    return entry[start : entry.index(b'"', start)]
+
+
+def extract_path(entry: bytes) -> bytes:
+    """Extract the requested path from the given entry"""
+    parts = extract_request(entry).split(b" ")
+    return parts[1] if len(parts) > 1 else parts[0]
+
+
+def extract_status(entry: bytes) -> bytes:
+    """Extract the response status code from the given entry"""
+    start = entry.index(b'"', entry.index(b'"') + 1) + 2
+    return entry[start : start + 3]
+
+
+def extract_user_agent(entry: bytes) -> bytes:
+    """Extract the user agent, which is the last quoted field of the given entry"""
+    return entry.rstrip().rsplit(b'"', 2)[-2]
+
+
+FIELDS = {
+    "ip": extract_ip,
+    "path": extract_path,
+    "status": extract_status,
+    "user_agent": extract_user_agent,
+    "minute": extract_minute,
+    "hour": extract_hour,
+}
+
+
+class Aggregation:
+    """
+    Counts requests and bytes sent grouped by the given fields in one pass.
+
+    Only fields used for grouping are extracted from the entries. Keys are
+    tuples of undecoded field values, and requests and bytes are stored in
+    two separate counters.
+
+    Without a capacity every group is counted exactly, so memory grows with the
+    number of distinct keys. With a capacity at most that many groups are kept,
+    as in SpaceSaving: a new group replaces the group with the fewest bytes and
+    takes over its counts. Bytes and requests of the kept groups are then upper
+    bounds, exceeding the real bytes by at most the bytes of the lightest group,
+    and every group with more than total bytes / capacity is kept.
+    """
+
+    def __init__(self, group_by: Iterable[str], capacity: int | None = None) -> None:
+        """
+        :param group_by: names of the fields to group by
+        :param capacity: maximum number of groups to keep, unlimited if None
+        """
+        self.group_by = tuple(group_by)
+        unknown_fields = set(self.group_by) - FIELDS.keys()
+        if unknown_fields:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown_fields))}")
+        self.extractors = [FIELDS[name] for name in self.group_by]
+        self.capacity = capacity
+        self.requests = Counter()
+        self.bytes = Counter()
+        # (bytes, key) of every group when bounded, entries may lag behind the
+        # counters and are refreshed when they reach the top
+        self.heap = []
+
+    def add(self, entry: bytes) -> None:
+        """
+        Add a single entry to the aggregation, blank lines are skipped
+
+        :raises ValueError: if the entry is not in the combined format
+        """
+        if not entry.strip():
+            return
+        try:
+            key = tuple(extract(entry) for extract in self.extractors)
+        except (ValueError, IndexError) as e:
+            raise malformed_entry_error(entry) from e
+        bytes_ = extract_bytes_raw(entry)
+        if self.capacity is None or key in self.bytes:
+            self.requests[key] += 1
+            self.bytes[key] += bytes_
+            return
+        if len(self.bytes) < self.capacity:
+            self.requests[key] = 1
+            self.bytes[key] = bytes_
+            heapq.heappush(self.heap, (bytes_, key))
+            return
+        lightest_bytes, lightest = self.heap[0]
+        while self.bytes[lightest] != lightest_bytes:
+            heapq.heapreplace(self.heap, (self.bytes[lightest], lightest))
+            lightest_bytes, lightest = self.heap[0]
+        self.requests[key] = self.requests.pop(lightest) + 1
+        self.bytes[key] = self.bytes.pop(lightest) + bytes_
+        heapq.heapreplace(self.heap, (self.bytes[key], key))
+
+    def add_lines(self, entries: Iterable[bytes]) -> "Aggregation":
+        """Add all entries to the aggregation and return it"""
+        for entry in entries:
+            self.add(entry)
+        return self
+
+    def merge(self, other: "Aggregation") -> "Aggregation":
+        """Add results of another aggregation with the same grouping to this one"""
+        if other.group_by != self.group_by:
+            raise ValueError("Can't merge aggregations with different grouping")
+        self.requests.update(other.requests)
+        self.bytes.update(other.bytes)
+        if self.capacity is not None:
+            kept = heapq.nlargest(
+                self.capacity, self.bytes.items(), key=lambda item: item[1]
+            )
+            self.requests = Counter({key: self.requests[key] for key, _ in kept})
+            self.bytes = Counter(dict(kept))
+            self.heap = [(bytes_, key) for key, bytes_ in kept]
+            heapq.heapify(self.heap)
+        return self
+
+    def top(self, n: int | None = None, by: str = "bytes") -> list[tuple[tuple, int, int]]:
+        """
+        Get the groups with the largest number of bytes or requests.
+
+        :param n: number of groups to return, all groups if None
+        :param by: "bytes" or "requests"
+        :return: list of (key, requests, bytes) sorted in descending order
+        """
+        counter = {"bytes": self.bytes, "requests": self.requests}[by]
+        return [
+            (key, self.requests[key], self.bytes[key])
+            for key, _ in counter.most_common(n)
+        ]
+
+
+def aggregate_log(
+    nginx_log_path: str, group_by: Iterable[str], capacity: int | None = None
+) -> Aggregation:
+    """Aggregate the log file of nginx by the given fields in one streaming pass"""
+    with open_log(nginx_log_path) as f:
+        return Aggregation(group_by, capacity).add_lines(iter_lines(f))
@@ -0,0 +1,155 @@
+"""Benchmark of the nginx log entry parsers and byte summing strategies."""
+
+import argparse
+import json
+import mmap
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from log_generator import generate_log
+from main import (
+    extract_bytes,
+    extract_bytes_raw,
+    sum_bytes_sent_and_received,
+    sum_bytes_sent_and_received_parallel,
+)
+
+ENTRY = (
+    '91.243.6.52 - - [07/May/2017:08:15:31 +0300] "GET /grade/report/user/index.php?id=3 HTTP/1.0" '
+    '200 60640 "http://learn.topnode.if.ua/course/view.php?id=3" '
+    '"Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"\n'
+)
+
+
+def extract_bytes_findall(entry: str) -> int:
+    """Original implementation that scans the whole decoded entry"""
+    return int(re.findall(r"\d{3} (\d*) ", entry)[0])
+
+
+def sum_serial(nginx_log_path: str, workers: int) -> int:
+    """Original implementation that decodes every line"""
+    with open(nginx_log_path, "r") as f:
+        return sum(extract_bytes_findall(line) for line in f)
+
+
+def sum_bytes_level(nginx_log_path: str, workers: int) -> int:
+    return sum_bytes_sent_and_received(nginx_log_path)
+
+
+def sum_mmap(nginx_log_path: str, workers: int) -> int:
+    """Sum the whole memory-mapped file in a single process"""
+    with open(nginx_log_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        return sum(map(extract_bytes_raw, iter(mm.readline, b"")))
+
+
+def sum_multiprocess(nginx_log_path: str, workers: int) -> int:
+    return sum_bytes_sent_and_received_parallel(nginx_log_path, workers)
+
+
+STRATEGIES = {
+    "serial": sum_serial,
+    "bytes": sum_bytes_level,
+    "mmap": sum_mmap,
+    "multiprocess": sum_multiprocess,
+}
+
+
+def lines_per_second(parser: callable, entry: str | bytes, number: int) -> float:
+    """Measure how many entries per second the parser handles"""
+    return number / timeit.timeit(lambda: parser(entry), number=number)
+
+
+def run_strategy(strategy: str, nginx_log_path: str, workers: int) -> dict:
+    """Run the strategy in this process and measure it, including worker processes"""
+    start = time.perf_counter()
+    result = STRATEGIES[strategy](nginx_log_path, workers)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return {"result": result, "elapsed": elapsed, "peak_rss": peak_rss * 1024}
+
+
+def measure_strategy(strategy: str, nginx_log_path: str, workers: int) -> dict:
+    """Run the strategy in a fresh interpreter, so peak RSS isn't shared"""
+    output = subprocess.run(
+        [sys.executable, __file__, "--run", strategy, nginx_log_path, "--workers", str(workers)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def benchmark_strategies(nginx_log_path: str, workers: int, strategies: list[str]) -> None:
+    size = os.path.getsize(nginx_log_path)
+    with open(nginx_log_path, "rb") as f:
+        lines = sum(1 for _ in f)
+    print(f"{nginx_log_path}: {size / 2**20:.1f} MB, {lines:,} lines, {workers} workers")
+    for strategy in strategies:
+        measurement = measure_strategy(strategy, nginx_log_path, workers)
+        elapsed = measurement["elapsed"]
+        print(
+            f"{strategy:<14} {size / 2**20 / elapsed:>9.1f} MB/s "
+            f"{lines / elapsed:>13,.0f} lines/s "
+            f"{measurement['peak_rss'] / 2**20:>8.1f} MB peak RSS "
+            f"result {measurement['result']}"
+        )
+
+
+def benchmark_parsers(number: int = 200_000) -> None:
+    parsers = [
+        ("str, re.findall", extract_bytes_findall, ENTRY),
+        ("str wrapper", extract_bytes, ENTRY),
+        ("bytes, precompiled", extract_bytes_raw, ENTRY.encode()),
+    ]
+    for name, parser, entry in parsers:
+        print(f"{name:<20} {lines_per_second(parser, entry, number):>12,.0f} lines/s")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "path", nargs="?", help="log file to benchmark, generated if omitted"
+    )
+    arg_parser.add_argument(
+        "--size", type=float, default=100, help="size of the generated log in MB"
+    )
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument(
+        "--malformed", type=float, default=0.01, help="share of malformed requests"
+    )
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument(
+        "--strategies",
+        default=",".join(STRATEGIES),
+        help="comma separated strategies: " + ", ".join(STRATEGIES),
+    )
+    arg_parser.add_argument("--run", choices=STRATEGIES, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.run:
+        print(json.dumps(run_strategy(args.run, args.path, args.workers)))
+        return
+    benchmark_parsers()
+    strategies = args.strategies.split(",")
+    if args.path:
+        benchmark_strategies(args.path, args.workers, strategies)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "nginx.txt")
+        generate_log(path, int(args.size * 2**20), args.seed, args.malformed)
+        benchmark_strategies(path, args.workers, strategies)
+
+
+if __name__ == "__main__":
+    main()
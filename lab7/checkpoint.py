@@ -0,0 +1,76 @@
+"""Module for summing bytes of append-only nginx logs incrementally between runs."""
+
+import hashlib
+import json
+import os
+from typing import BinaryIO
+
+from main import extract_bytes_raw
+
+BLOCK_SIZE = 4096
+
+
+def block_hash(f: BinaryIO, offset: int) -> str:
+    """Hash the block of the file that ends at the given offset"""
+    start = max(offset - BLOCK_SIZE, 0)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def load_checkpoint(checkpoint_path: str) -> dict | None:
+    """Load the checkpoint, return None if it is missing or damaged"""
+    try:
+        with open(checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+        return {key: checkpoint[key] for key in ("inode", "offset", "bytes_sum", "block_hash")}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    """Atomically replace the checkpoint file"""
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, checkpoint_path)
+
+
+def sum_bytes_incrementally(nginx_log_path: str, checkpoint_path: str | None = None) -> int:
+    """
+    Calculate the total number of bytes sent and received in the log file of nginx,
+    resuming from the checkpoint of the previous run if the file was only appended to.
+
+    The file is considered unchanged if it has the same inode, is not shorter than
+    the checkpoint offset and the block before that offset has the same hash.
+    An incomplete last line is left for the next run.
+
+    :param nginx_log_path: path to the log file of nginx
+    :param checkpoint_path: path to the checkpoint, defaults to <log path>.checkpoint
+    :return: total number of bytes
+    """
+    checkpoint_path = checkpoint_path or nginx_log_path + ".checkpoint"
+    with open(nginx_log_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        checkpoint = load_checkpoint(checkpoint_path)
+        offset, bytes_sum = 0, 0
+        if (
+            checkpoint
+            and checkpoint["inode"] == stat.st_ino
+            and checkpoint["offset"] <= stat.st_size
+            and block_hash(f, checkpoint["offset"]) == checkpoint["block_hash"]
+        ):
+            offset, bytes_sum = checkpoint["offset"], checkpoint["bytes_sum"]
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            bytes_sum += extract_bytes_raw(line)
+            offset += len(line)
+        checkpoint = {
+            "inode": stat.st_ino,
+            "offset": offset,
+            "bytes_sum": bytes_sum,
+            "block_hash": block_hash(f, offset),
+        }
+    save_checkpoint(checkpoint_path, checkpoint)
+    return bytes_sum
@@ -0,0 +1,135 @@
+"""Module for converting nginx logs to typed column files and analysing them with NumPy."""
+
+import json
+import os
+from array import array
+from functools import lru_cache
+
+import numpy as np
+
+from aggregation import extract_ip, extract_path, extract_status, extract_time
+from main import extract_bytes_raw, iter_lines, malformed_entry_error, open_log
+from time_index import parse_local_time
+
+COLUMNS = {
+    "timestamp": ("q", np.int64),
+    "status": ("H", np.uint16),
+    "bytes": ("I", np.uint32),
+    "path": ("I", np.uint32),
+    "ip": ("I", np.uint32),
+}
+DICTIONARY_COLUMNS = ("path", "ip")
+FLUSH_ROWS = 1 << 20
+
+
+# many consecutive entries share the same second
+_parse_cached_time = lru_cache(maxsize=4096)(parse_local_time)
+
+
+class _Dictionary(dict):
+    """Maps values to their codes, assigning the next code to every new value."""
+
+    def __missing__(self, value: bytes) -> int:
+        self[value] = len(self)
+        return self[value]
+
+
+def export_columns(nginx_log_path: str, output_dir: str) -> int:
+    """
+    Convert the log file of nginx to one binary file per column.
+
+    Timestamps are stored as int64, statuses as uint16, bytes as uint32, and paths
+    and IP addresses as uint32 codes of values listed in <column>.dict files.
+    Blank lines are skipped.
+
+    :param nginx_log_path: path to the log file of nginx, possibly compressed
+    :param output_dir: directory for the column files, created if needed
+    :return: number of exported rows
+    :raises ValueError: if an entry is not in the combined format
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    buffers = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+    dictionaries = {name: _Dictionary() for name in DICTIONARY_COLUMNS}
+    files = {name: open(os.path.join(output_dir, f"{name}.bin"), "wb") for name in COLUMNS}
+    rows = 0
+    try:
+        with open_log(nginx_log_path) as f:
+            for line in iter_lines(f):
+                if not line.strip():
+                    continue
+                try:
+                    timestamp = _parse_cached_time(extract_time(line))
+                    status = int(extract_status(line))
+                    bytes_ = extract_bytes_raw(line)
+                    path = extract_path(line)
+                    ip = extract_ip(line)
+                except (ValueError, IndexError) as e:
+                    raise malformed_entry_error(line) from e
+                buffers["timestamp"].append(timestamp)
+                buffers["status"].append(status)
+                buffers["bytes"].append(bytes_)
+                buffers["path"].append(dictionaries["path"][path])
+                buffers["ip"].append(dictionaries["ip"][ip])
+                rows += 1
+                if rows % FLUSH_ROWS == 0:
+                    for name, buffer in buffers.items():
+                        buffer.tofile(files[name])
+                        del buffer[:]
+        for name, buffer in buffers.items():
+            buffer.tofile(files[name])
+    finally:
+        for file in files.values():
+            file.close()
+    for name, dictionary in dictionaries.items():
+        with open(os.path.join(output_dir, f"{name}.dict"), "wb") as f:
+            f.write(b"\n".join(dictionary))
+    with open(os.path.join(output_dir, "metadata.json"), "w") as f:
+        json.dump({"rows": rows}, f)
+    return rows
+
+
+class ColumnarLog:
+    """Memory-mapped columns of a log exported with export_columns."""
+
+    def __init__(self, columns_dir: str) -> None:
+        with open(os.path.join(columns_dir, "metadata.json"), "r") as f:
+            self.rows = json.load(f)["rows"]
+        self.columns = {
+            name: self._map(os.path.join(columns_dir, f"{name}.bin"), dtype)
+            for name, (_, dtype) in COLUMNS.items()
+        }
+        self.dictionaries = {}
+        for name in DICTIONARY_COLUMNS:
+            with open(os.path.join(columns_dir, f"{name}.dict"), "rb") as f:
+                data = f.read()
+            self.dictionaries[name] = data.split(b"\n") if self.rows else []
+
+    def _map(self, path: str, dtype: type) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(self.rows,))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def sum_bytes(self) -> int:
+        """Calculate the total number of bytes sent"""
+        return int(self["bytes"].sum(dtype=np.uint64))
+
+    def sum_bytes_in_range(self, start: int, end: int) -> int:
+        """Calculate the number of bytes sent with timestamps in [start, end)"""
+        mask = (self["timestamp"] >= start) & (self["timestamp"] < end)
+        return int(self["bytes"][mask].sum(dtype=np.uint64))
+
+    def bytes_by_status(self) -> dict[int, int]:
+        """Calculate the number of bytes sent grouped by status code"""
+        statuses, inverse = np.unique(self["status"], return_inverse=True)
+        sums = np.bincount(inverse, weights=self["bytes"], minlength=len(statuses))
+        return {int(status): int(sum_) for status, sum_ in zip(statuses, sums)}
+
+    def top_by_bytes(self, column: str, n: int = 10) -> list[tuple[bytes, int]]:
+        """Get the paths or IP addresses with the largest number of bytes sent"""
+        dictionary = self.dictionaries[column]
+        sums = np.bincount(self[column], weights=self["bytes"], minlength=len(dictionary))
+        top = np.argsort(sums)[::-1][:n]
+        return [(dictionary[code], int(sums[code])) for code in top]
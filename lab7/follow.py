@@ -0,0 +1,151 @@
+"""Module for following a growing nginx log file like `tail -F` does."""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from collections.abc import Iterator
+
+from main import extract_bytes_raw
+
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class PollingWatcher:
+    """Waits for file changes by simply sleeping for the given timeout."""
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(timeout)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Waits for changes in the directory of the log file using Linux inotify."""
+
+    def __init__(self, path: str) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.path.dirname(os.path.abspath(path)).encode()
+        mask = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, directory, mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout: float) -> None:
+        """Block until any event in the watched directory or the timeout"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def create_watcher(path: str) -> InotifyWatcher | PollingWatcher:
+    """Create an inotify watcher where available and fall back to polling"""
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher()
+
+
+class LogFollower:
+    """
+    Follows the log file of nginx and keeps a running total of bytes sent.
+
+    Rotated files are read to the end before switching to the new file, and
+    truncated files are read again from the start.
+    """
+
+    def __init__(self, nginx_log_path: str, from_start: bool = False) -> None:
+        self.path = nginx_log_path
+        self.total = 0
+        self.file = None
+        self.buffer = b""
+        self.open(seek_end=not from_start)
+
+    def open(self, seek_end: bool = False) -> None:
+        """Open the log file, if it exists, replacing the currently followed one"""
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.buffer = b""
+        try:
+            self.file = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        if seek_end:
+            self.file.seek(0, os.SEEK_END)
+
+    def read_new_lines(self) -> int:
+        """Add bytes of newly appended complete lines to the total and return them"""
+        if not self.file:
+            return 0
+        data = self.buffer + self.file.read()
+        data, _, self.buffer = data.rpartition(b"\n")
+        new_bytes = sum(map(extract_bytes_raw, data.split(b"\n"))) if data else 0
+        self.total += new_bytes
+        return new_bytes
+
+    def check_file(self) -> int:
+        """Handle rotation and truncation of the log file, return bytes read meanwhile"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        if not self.file:
+            self.open()
+            return 0
+        new_bytes = 0
+        if stat.st_ino != os.fstat(self.file.fileno()).st_ino:
+            new_bytes = self.read_new_lines()
+            self.open()
+        elif stat.st_size < self.file.tell():
+            self.file.seek(0)
+            self.buffer = b""
+        return new_bytes
+
+    def follow(
+        self, interval: float = 1.0, watcher: InotifyWatcher | PollingWatcher = None
+    ) -> Iterator[tuple[int, float]]:
+        """
+        Follow the log file forever.
+
+        :param interval: seconds between reports
+        :param watcher: object used to wait for changes, created automatically if omitted
+        :return: iterator of (running total of bytes, bytes per second during the interval)
+        """
+        watcher = watcher or create_watcher(self.path)
+        try:
+            last_report = time.monotonic()
+            last_total = self.total
+            while True:
+                self.check_file()
+                self.read_new_lines()
+                now = time.monotonic()
+                elapsed = now - last_report
+                if elapsed >= interval:
+                    yield self.total, (self.total - last_total) / elapsed if elapsed else 0.0
+                    last_report, last_total = now, self.total
+                watcher.wait(max(last_report + interval - time.monotonic(), 0))
+        finally:
+            watcher.close()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
@@ -0,0 +1,112 @@
+"""Deterministic generator of nginx logs in the combined format."""
+
+import argparse
+import random
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+
+PATHS = [
+    "/",
+    "/login/index.php",
+    "/course/view.php?id={}",
+    "/mod/quiz/view.php?id={}",
+    "/mod/quiz/attempt.php?attempt={}&page={}",
+    "/grade/report/user/index.php?id={}",
+    "/lib/editor/atto/autosave-ajax.php",
+    "/theme/image.php/clean/core/{}/t/edit",
+    "/pluginfile.php/{}/mod_resource/content/1/lecture.pdf",
+]
+METHODS = ["GET"] * 8 + ["POST"] * 2
+STATUSES = [200] * 80 + [303] * 8 + [304] * 6 + [404] * 4 + [500] * 2
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 5.1; rv:52.0) Gecko/20100101 Firefox/52.0",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/58.0.3029.96 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 10_3_1 like Mac OS X) AppleWebKit/603.1.30 "
+    "(KHTML, like Gecko) Version/10.0 Mobile/14E304 Safari/602.1",
+    "curl/7.52.1",
+]
+# requests that nginx logs as they are, e.g. TLS handshakes sent to a plain HTTP port
+MALFORMED_REQUESTS = [
+    "\\x16\\x03\\x01\\x00\\xA5\\x01\\x00\\x00\\xA1\\x03\\x03",
+    "",
+    "GET /{}",
+    "GET /../../../../etc/passwd HTTP/1.1",
+    "GET /" + "A" * 2000 + " HTTP/1.1",
+]
+START_TIME = datetime(2017, 5, 7, tzinfo=timezone(timedelta(hours=3)))
+
+
+def generate_entries(
+    seed: int = 0, malformed_ratio: float = 0.0, start_time: datetime = START_TIME
+) -> Iterator[str]:
+    """
+    Generate an endless sequence of log entries, the same for the same seed.
+
+    :param seed: seed of the random generator
+    :param malformed_ratio: share of entries with malformed requests answered with 400
+    :param start_time: time of the first entry
+    :return: iterator of entries without line endings
+    """
+    rng = random.Random(seed)
+    ips = [
+        ".".join(str(rng.randint(1, 254)) for _ in range(4)) for _ in range(1000)
+    ]
+    # a few clients make most of the requests
+    ip_weights = [1 / (rank + 1) for rank in range(len(ips))]
+    time = start_time
+    while True:
+        time += timedelta(milliseconds=rng.randint(0, 400))
+        ip = rng.choices(ips, ip_weights)[0]
+        if rng.random() < malformed_ratio:
+            request = rng.choice(MALFORMED_REQUESTS).format(rng.randint(1, 999))
+            status, bytes_, referer, user_agent = 400, rng.randint(150, 180), "-", "-"
+        else:
+            path = rng.choice(PATHS).format(rng.randint(1, 200), rng.randint(0, 9))
+            request = f"{rng.choice(METHODS)} {path} HTTP/1.0"
+            status = rng.choice(STATUSES)
+            bytes_ = 0 if status == 304 else int(rng.lognormvariate(8, 2))
+            referer = f"http://learn.topnode.if.ua{rng.choice(PATHS).format(1, 0)}"
+            user_agent = rng.choice(USER_AGENTS)
+        yield (
+            f'{ip} - - [{time:%d/%b/%Y:%H:%M:%S %z}] "{request}" {status} {bytes_} '
+            f'"{referer}" "{user_agent}"'
+        )
+
+
+def generate_log(
+    nginx_log_path: str, size: int, seed: int = 0, malformed_ratio: float = 0.0
+) -> int:
+    """
+    Write a log file of at least the given size in bytes.
+
+    :return: number of written lines
+    """
+    written = lines = 0
+    with open(nginx_log_path, "wb") as f:
+        for entry in generate_entries(seed, malformed_ratio):
+            if written >= size:
+                break
+            line = entry.encode() + b"\n"
+            f.write(line)
+            written += len(line)
+            lines += 1
+    return lines
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Generate a synthetic nginx log")
+    arg_parser.add_argument("path", help="path to the generated log file")
+    arg_parser.add_argument("size", type=float, help="size of the log file in MB")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument(
+        "--malformed", type=float, default=0.0, help="share of malformed requests"
+    )
+    args = arg_parser.parse_args()
+    lines = generate_log(args.path, int(args.size * 2**20), args.seed, args.malformed)
+    print(f"{lines} lines written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,309 @@
+import argparse
+import bz2
+import gzip
+import mmap
+import os
 import re
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import BinaryIO
+
+
+BYTES_SENT_PATTERN = re.compile(rb"\d{3} (\d*) ")
+BLOCK_SIZE = 1 << 20
+MAGIC_NUMBERS = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+
+def malformed_entry_error(entry: bytes) -> ValueError:
+    """Create the error for an entry that is not in the combined format"""
+    return ValueError(f"Malformed log entry: {entry[:200]!r}")
+
+
+def extract_bytes_raw(entry: bytes) -> int:
+    """
+    Extract the number of bytes sent from the given undecoded entry.
+
+    Blank lines have no bytes sent, so 0 is returned for them.
+
+    :raises ValueError: if the entry has no status and bytes sent
+    """
+    match = BYTES_SENT_PATTERN.search(entry)
+    if match is None:
+        if not entry.strip():
+            return 0
+        raise malformed_entry_error(entry)
+    return int(match[1])
 
 
 def extract_bytes(entry: str) -> int:
     """Extract the number of bytes sent from the given entry"""
-    return int(re.findall(r"\d{3} (\d*) ", entry)[0])
+    return extract_bytes_raw(entry.encode())
+
+
+def detect_compression(nginx_log_path: str) -> str | None:
+    """Detect the compression of the file by its magic number, None for plain text"""
+    with open(nginx_log_path, "rb") as f:
+        header = f.read(4)
+    for magic, compression in MAGIC_NUMBERS.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def open_log(nginx_log_path: str) -> BinaryIO:
+    """Open the log file for binary reading, decompressing it on the fly if needed"""
+    compression = detect_compression(nginx_log_path)
+    if compression == "gzip":
+        return gzip.open(nginx_log_path, "rb")
+    if compression == "bz2":
+        return bz2.open(nginx_log_path, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard package is required to read .zst logs")
+        return zstandard.open(nginx_log_path, "rb")
+    return open(nginx_log_path, "rb")
+
+
+def iter_lines(f: BinaryIO, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Read the file in large blocks and yield lines without line endings"""
+    remainder = b""
+    while block := f.read(block_size):
+        lines = (remainder + block).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
 
 
 def sum_bytes_sent_and_received(nginx_log_path: str) -> int:
     """Calculate the total number of bytes sent and received in the log file of nginx"""
-    with open(nginx_log_path, "r") as f:
-        bytes_sum = sum(extract_bytes(line) for line in f)
+    with open_log(nginx_log_path) as f:
+        bytes_sum = sum(map(extract_bytes_raw, iter_lines(f)))
     return bytes_sum
 
 
+def sum_bytes_of_files(nginx_log_paths: list[str], workers: int | None = None) -> int:
+    """
+    Calculate the total number of bytes sent and received in several log files,
+    for example rotated and compressed ones, each file in its own worker process.
+
+    :param nginx_log_paths: paths to the log files of nginx
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: total number of bytes in all files
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(sum_bytes_sent_and_received, nginx_log_paths))
+
+
+def split_into_chunks(nginx_log_path: str, chunks_count: int) -> list[tuple[int, int]]:
+    """
+    Split the log file into byte ranges that start and end on line boundaries.
+
+    :param nginx_log_path: path to the log file of nginx
+    :param chunks_count: desired number of chunks, fewer are returned for small files
+    :return: list of (start, end) offsets covering the whole file
+    """
+    size = os.path.getsize(nginx_log_path)
+    if size == 0:
+        return []
+    chunk_size = max(size // chunks_count, 1)
+    chunks = []
+    with open(nginx_log_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        start = 0
+        while start < size:
+            end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def _sum_chunk(nginx_log_path: str, start: int, end: int) -> int:
+    """Sum bytes of the lines located in the given byte range of the log file"""
+    with open(nginx_log_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        mm.seek(start)
+        bytes_sum = 0
+        while mm.tell() < end:
+            bytes_sum += extract_bytes_raw(mm.readline())
+    return bytes_sum
+
+
+def sum_bytes_sent_and_received_parallel(
+    nginx_log_path: str, workers: int | None = None
+) -> int:
+    """
+    Calculate the total number of bytes sent and received in the log file of nginx
+    using several processes, each of which handles its own newline-aligned chunk
+    of the memory-mapped file.
+
+    :param nginx_log_path: path to the log file of nginx
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: the same result as sum_bytes_sent_and_received
+    """
+    if detect_compression(nginx_log_path):
+        # compressed streams can't be split into chunks
+        return sum_bytes_sent_and_received(nginx_log_path)
+    workers = workers or os.cpu_count() or 1
+    chunks = split_into_chunks(nginx_log_path, workers)
+    if not chunks:
+        return 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_sum_chunk, nginx_log_path, start, end)
+            for start, end in chunks
+        ]
+        return sum(future.result() for future in futures)
+
+
 def main():
-    nginx_log_path = "2017_05_07_nginx.txt"
-    print(sum_bytes_sent_and_received(nginx_log_path))
+    arg_parser = argparse.ArgumentParser(
+        description="Calculate the total number of bytes sent and received in the log file of nginx"
+    )
+    arg_parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["2017_05_07_nginx.txt"],
+        help="paths to the log files, plain or compressed with gzip, bzip2 or zstd",
+    )
+    arg_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="process the file in parallel using the given number of processes",
+    )
+    arg_parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="follow the growing file and print the running total and rate",
+    )
+    arg_parser.add_argument(
+        "-c",
+        "--checkpoint",
+        action="store_true",
+        help="resume from the checkpoint of the previous run and save a new one",
+    )
+    arg_parser.add_argument(
+        "-i",
+        "--index",
+        action="store_true",
+        help="build or extend the sidecar time index and print its total",
+    )
+    arg_parser.add_argument(
+        "-g",
+        "--group-by",
+        help="comma separated fields to group requests and bytes by: "
+        "ip, path, status, user_agent, minute, hour",
+    )
+    arg_parser.add_argument(
+        "--top", type=int, default=10, help="number of groups to print"
+    )
+    arg_parser.add_argument(
+        "--max-groups",
+        type=int,
+        help="keep at most this many groups by bytes, so memory stays bounded "
+        "and the counts of the printed groups are upper bounds",
+    )
+    arg_parser.add_argument(
+        "-s",
+        "--sketch",
+        help="estimate unique values and top values by bytes of the given field",
+    )
+    arg_parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="with --until, sum bytes in the time range using the sidecar index, "
+        "e.g. 2017-05-07T14:00+03:00",
+    )
+    arg_parser.add_argument("--until", type=datetime.fromisoformat)
+    arg_parser.add_argument(
+        "--export-columns",
+        metavar="DIR",
+        help="convert the log to binary column files in the given directory",
+    )
+    arg_parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="seconds between reports in follow mode",
+    )
+    args = arg_parser.parse_args()
+    if (args.since is None) != (args.until is None):
+        arg_parser.error("--since and --until must be given together")
+    single_file_modes = {
+        "--export-columns": args.export_columns,
+        "--since": args.since,
+        "--group-by": args.group_by,
+        "--sketch": args.sketch,
+        "--follow": args.follow,
+        "--checkpoint": args.checkpoint,
+        "--index": args.index,
+    }
+    if len(args.paths) > 1:
+        for option, value in single_file_modes.items():
+            if value:
+                arg_parser.error(f"{option} works with a single file")
+    args.path = args.paths[0]
+    if len(args.paths) > 1:
+        print(sum_bytes_of_files(args.paths, args.workers))
+    elif args.export_columns:
+        from columnar import export_columns
+
+        print(f"{export_columns(args.path, args.export_columns)} rows exported")
+    elif args.since and args.until:
+        from time_index import sum_bytes_in_range
+
+        print(sum_bytes_in_range(args.path, args.since, args.until))
+    elif args.group_by:
+        from aggregation import aggregate_log
+
+        aggregation = aggregate_log(
+            args.path, args.group_by.split(","), args.max_groups
+        )
+        for key, requests, bytes_ in aggregation.top(args.top):
+            fields = " ".join(field.decode(errors="replace") for field in key)
+            print(f"{fields}\t{requests}\t{bytes_}")
+    elif args.sketch:
+        from sketches import sketch_log
+
+        sketches = sketch_log(args.path, args.sketch)
+        print(f"unique: ~{sketches.unique.count()}")
+        for value, bytes_ in sketches.top_talkers.top(args.top):
+            print(f"{value.decode(errors='replace')}\t~{bytes_}")
+    elif args.follow:
+        from follow import LogFollower
+
+        follower = LogFollower(args.path)
+        try:
+            for total, rate in follower.follow(args.interval):
+                print(f"total: {total} B, rate: {rate:.1f} B/s", flush=True)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            follower.close()
+    elif args.checkpoint:
+        from checkpoint import sum_bytes_incrementally
+
+        print(sum_bytes_incrementally(args.path))
+    elif args.index:
+        from time_index import sum_bytes_indexed
+
+        print(sum_bytes_indexed(args.path))
+    elif args.workers:
+        print(sum_bytes_sent_and_received_parallel(args.path, args.workers))
+    else:
+        print(sum_bytes_sent_and_received(args.path))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""Module with fixed-memory sketches for approximate analytics of nginx logs."""
+
+import hashlib
+import heapq
+import math
+import pickle
+from array import array
+from collections.abc import Iterable
+
+from aggregation import FIELDS
+from main import extract_bytes_raw, iter_lines, malformed_entry_error, open_log
+
+
+def hash64(value: bytes) -> int:
+    """Calculate a 64-bit hash of the value, stable between processes"""
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+class Sketch:
+    """Base class of sketches which can be saved to and loaded from disk."""
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path: str) -> "Sketch":
+        with open(path, "rb") as f:
+            sketch = pickle.load(f)
+        if not isinstance(sketch, cls):
+            raise TypeError(f"{path} doesn't contain {cls.__name__}")
+        return sketch
+
+
+class HyperLogLog(Sketch):
+    """
+    Estimates the number of distinct values using 2 ** precision registers.
+
+    The standard error is about 1.04 / sqrt(2 ** precision).
+    """
+
+    def __init__(self, precision: int = 14) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: bytes) -> None:
+        hash_ = hash64(value)
+        index = hash_ >> (64 - self.precision)
+        rest = hash_ & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Can't merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        """Estimate the number of distinct values added"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class CountMinSketch(Sketch):
+    """
+    Estimates sums of weights per value, never underestimating them.
+
+    With width w and depth d the error is at most e / w of the total weight
+    with probability 1 - exp(-d).
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 5) -> None:
+        self.width = width
+        self.depth = depth
+        self.table = [array("Q", bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, value: bytes) -> Iterable[int]:
+        hash_ = hash64(value)
+        first, second = hash_ & 0xFFFFFFFF, hash_ >> 32
+        return ((first + row * second) % self.width for row in range(self.depth))
+
+    def add(self, value: bytes, weight: int = 1) -> None:
+        for row, index in zip(self.table, self._indexes(value)):
+            row[index] += weight
+
+    def estimate(self, value: bytes) -> int:
+        return min(row[index] for row, index in zip(self.table, self._indexes(value)))
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Can't merge sketches with different dimensions")
+        for row, other_row in zip(self.table, other.table):
+            for index, weight in enumerate(other_row):
+                row[index] += weight
+        return self
+
+
+class SpaceSaving(Sketch):
+    """
+    Keeps at most capacity heaviest values by total weight.
+
+    Each estimate exceeds the real weight by at most the weight of the
+    lightest counter, and every value heavier than total / capacity is kept.
+
+    The lightest counter is found with a min-heap holding one entry per value.
+    Adding to a kept value doesn't update its entry, which may therefore be
+    lower than the counter, so stale entries are refreshed when they reach the
+    top. Weights only grow, so an entry that matches its counter at the top is
+    the lightest, and an eviction takes O(log capacity) amortized time.
+    """
+
+    def __init__(self, capacity: int = 100) -> None:
+        self.capacity = capacity
+        self.counters = {}
+        self.heap = []
+
+    def add(self, value: bytes, weight: int = 1) -> None:
+        if value in self.counters:
+            self.counters[value] += weight
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[value] = weight
+            heapq.heappush(self.heap, (weight, value))
+            return
+        lightest_weight, lightest = self.heap[0]
+        while self.counters[lightest] != lightest_weight:
+            heapq.heapreplace(self.heap, (self.counters[lightest], lightest))
+            lightest_weight, lightest = self.heap[0]
+        del self.counters[lightest]
+        self.counters[value] = lightest_weight + weight
+        heapq.heapreplace(self.heap, (lightest_weight + weight, value))
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        counters = dict(self.counters)
+        for value, weight in other.counters.items():
+            counters[value] = counters.get(value, 0) + weight
+        self.counters = dict(
+            heapq.nlargest(self.capacity, counters.items(), key=lambda item: item[1])
+        )
+        self.heap = [(weight, value) for value, weight in self.counters.items()]
+        heapq.heapify(self.heap)
+        return self
+
+    def top(self, n: int | None = None) -> list[tuple[bytes, int]]:
+        """Get the heaviest values with their estimated weights"""
+        items = sorted(self.counters.items(), key=lambda item: item[1], reverse=True)
+        return items[:n]
+
+
+class LogSketches(Sketch):
+    """Sketches of unique values and top values by bytes for the given field."""
+
+    def __init__(self, field: str = "ip", precision: int = 14, capacity: int = 100) -> None:
+        self.field = field
+        self.extract = FIELDS[field]
+        self.unique = HyperLogLog(precision)
+        self.bytes = CountMinSketch()
+        self.top_talkers = SpaceSaving(capacity)
+
+    def add(self, entry: bytes) -> None:
+        if not entry.strip():
+            return
+        try:
+            value = self.extract(entry)
+        except (ValueError, IndexError) as e:
+            raise malformed_entry_error(entry) from e
+        bytes_ = extract_bytes_raw(entry)
+        self.unique.add(value)
+        self.bytes.add(value, bytes_)
+        self.top_talkers.add(value, bytes_)
+
+    def add_lines(self, entries: Iterable[bytes]) -> "LogSketches":
+        for entry in entries:
+            self.add(entry)
+        return self
+
+    def merge(self, other: "LogSketches") -> "LogSketches":
+        if other.field != self.field:
+            raise ValueError("Can't merge sketches of different fields")
+        self.unique.merge(other.unique)
+        self.bytes.merge(other.bytes)
+        self.top_talkers.merge(other.top_talkers)
+        return self
+
+
+def sketch_log(nginx_log_path: str, field: str = "ip") -> LogSketches:
+    """Build sketches of the given field of the log file of nginx in one pass"""
+    with open_log(nginx_log_path) as f:
+        return LogSketches(field).add_lines(iter_lines(f))
@@ -1,6 +1,17 @@
 import pytest
 
-from main import extract_bytes, sum_bytes_sent_and_received
+import bz2
+import gzip
+
+from main import (
+    extract_bytes,
+    extract_bytes_raw,
+    detect_compression,
+    split_into_chunks,
+    sum_bytes_of_files,
+    sum_bytes_sent_and_received,
+    sum_bytes_sent_and_received_parallel,
+)
 
 test_data = [
     """213.109.238.193 - - [07/May/2017:00:08:35 +0300] "GET /question/edit.php?cmid=1&cat=1%2C18&qpage=0&category=7%2C131&qbshowtext=0&recurse=0&recurse=1&showhidden=0&showhidden=1 HTTP/1.0" 303 440 "http://learn.topnode.if.ua/question/edit.php" "Mozilla/5.0 (Windows NT 5.1; rv:52.0) Gecko/20100101 Firefox/52.0""",
@@ -19,12 +30,64 @@ test_data = [
 )
 def test_extract_bytes(entry: str, bytes_) -> None:
     assert extract_bytes(entry) == bytes_
+    assert extract_bytes_raw(entry.encode()) == bytes_
+
+
+def test_extract_bytes_of_malformed_entry() -> None:
+    assert extract_bytes("") == 0
+    assert extract_bytes_raw(b"\r\n") == 0
+    with pytest.raises(ValueError, match="garbage"):
+        extract_bytes("garbage")
+    with pytest.raises(ValueError, match="Malformed"):
+        extract_bytes_raw(test_data[2][:60].encode())
 
 
 @pytest.fixture
 def nginx_log_file(mocker) -> None:
-    mocker.patch("main.open", mocker.mock_open(read_data="\n".join(test_data)))
+    mocker.patch("main.open", mocker.mock_open(read_data="\n".join(test_data).encode()))
 
 
 def test_sum_bytes_sent_and_received(nginx_log_file) -> None:
     assert sum_bytes_sent_and_received("some_file.txt") == 61080
+
+
+@pytest.fixture
+def nginx_log_path(tmp_path) -> str:
+    path = tmp_path / "nginx.txt"
+    path.write_text("\n".join(test_data * 50) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunks_count", [1, 2, 7, 1000])
+def test_split_into_chunks(nginx_log_path: str, chunks_count: int) -> None:
+    chunks = split_into_chunks(nginx_log_path, chunks_count)
+    with open(nginx_log_path, "rb") as f:
+        data = f.read()
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start and data[end - 1 : end] == b"\n"
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_sum_bytes_sent_and_received_parallel(nginx_log_path: str, workers: int) -> None:
+    assert sum_bytes_sent_and_received_parallel(
+        nginx_log_path, workers
+    ) == sum_bytes_sent_and_received(nginx_log_path)
+
+
+@pytest.mark.parametrize(
+    "compress, compression",
+    [(gzip.compress, "gzip"), (bz2.compress, "bz2")],
+)
+def test_compressed_log(tmp_path, compress: callable, compression: str) -> None:
+    path = tmp_path / f"access.log.1.{compression}"
+    path.write_bytes(compress("\n".join(test_data).encode()))
+    assert detect_compression(str(path)) == compression
+    assert sum_bytes_sent_and_received(str(path)) == 61080
+    assert sum_bytes_sent_and_received_parallel(str(path), 2) == 61080
+
+
+def test_sum_bytes_of_files(tmp_path, nginx_log_path: str) -> None:
+    compressed_path = tmp_path / "access.log.1.gz"
+    compressed_path.write_bytes(gzip.compress("\n".join(test_data).encode()))
+    assert sum_bytes_of_files([nginx_log_path, str(compressed_path)], 2) == 51 * 61080
@@ -0,0 +1,80 @@
+import pytest
+
+from aggregation import FIELDS, Aggregation, aggregate_log
+
+test_data = [
+    b'213.109.238.193 - - [07/May/2017:00:08:35 +0300] "GET /question/edit.php?cmid=1 HTTP/1.0" 303 440 "http://learn.topnode.if.ua/question/edit.php" "Mozilla/5.0 (Windows NT 5.1; rv:52.0) Gecko/20100101 Firefox/52.0"',
+    b'213.109.238.193 - - [07/May/2017:01:16:47 +0300] "POST /lib/editor/atto/autosave-ajax.php HTTP/1.0" 200 0 "-" "Mozilla/5.0 (Windows NT 5.1; rv:52.0) Gecko/20100101 Firefox/52.0"',
+    b'91.243.6.52 - - [07/May/2017:08:15:31 +0300] "GET /grade/report/user/index.php?id=3 HTTP/1.0" 200 60640 "http://learn.topnode.if.ua/course/view.php?id=3" "Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"',
+    b'91.243.6.52 - - [07/May/2017:08:15:59 +0300] "GET /grade/report/user/index.php?id=3 HTTP/1.0" 200 1000 "-" "curl/7.52.1"',
+]
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("ip", b"91.243.6.52"),
+        ("path", b"/grade/report/user/index.php?id=3"),
+        ("status", b"200"),
+        ("user_agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"),
+        ("minute", b"07/May/2017:08:15"),
+        ("hour", b"07/May/2017:08"),
+    ],
+)
+def test_fields(field: str, value: bytes) -> None:
+    assert FIELDS[field](test_data[2]) == value
+
+
+def test_aggregation() -> None:
+    aggregation = Aggregation(["status"]).add_lines(test_data)
+    assert aggregation.top() == [((b"200",), 3, 61640), ((b"303",), 1, 440)]
+    assert aggregation.top(1, by="requests") == [((b"200",), 3, 61640)]
+
+
+def test_only_requested_fields_are_extracted(mocker) -> None:
+    extract_path = mocker.patch.dict("aggregation.FIELDS", {"path": mocker.Mock()})
+    Aggregation(["ip"]).add_lines(test_data)
+    extract_path["path"].assert_not_called()
+
+
+def test_merge() -> None:
+    aggregation = Aggregation(["ip", "hour"]).add_lines(test_data[:2])
+    aggregation.merge(Aggregation(["ip", "hour"]).add_lines(test_data[2:]))
+    assert aggregation.top(1) == [((b"91.243.6.52", b"07/May/2017:08"), 2, 61640)]
+    with pytest.raises(ValueError):
+        aggregation.merge(Aggregation(["ip"]))
+
+
+def test_unknown_field() -> None:
+    with pytest.raises(ValueError):
+        Aggregation(["referer"])
+
+
+def test_aggregate_log(tmp_path) -> None:
+    path = tmp_path / "access.log"
+    path.write_bytes(b"\n".join(test_data) + b"\n")
+    aggregation = aggregate_log(str(path), ["path"])
+    assert aggregation.top(1) == [((b"/grade/report/user/index.php?id=3",), 2, 61640)]
+
+
+def test_bounded_aggregation() -> None:
+    entries = [test_data[2]] * 5 + [
+        f"10.0.0.{i} - - [07/May/2017:08:15:31 +0300] "
+        f'"GET / HTTP/1.0" 200 {i} "-" "curl/7.52.1"'.encode()
+        for i in range(100)
+    ]
+    aggregation = Aggregation(["ip"], capacity=10).add_lines(entries)
+    assert len(aggregation.bytes) == len(aggregation.requests) == 10
+    assert len(aggregation.heap) == 10
+    assert sum(aggregation.bytes.values()) == 5 * 60640 + sum(range(100))
+    assert aggregation.top(1) == [((b"91.243.6.52",), 5, 5 * 60640)]
+    aggregation.merge(Aggregation(["ip"], capacity=10).add_lines(entries))
+    assert len(aggregation.bytes) == 10
+    assert aggregation.top(1) == [((b"91.243.6.52",), 10, 10 * 60640)]
+
+
+def test_blank_and_malformed_entries() -> None:
+    aggregation = Aggregation(["user_agent", "status"]).add_lines([b"", b"  ", test_data[3]])
+    assert aggregation.top() == [((b"curl/7.52.1", b"200"), 1, 1000)]
+    with pytest.raises(ValueError, match="Malformed log entry"):
+        aggregation.add(test_data[2][:30])
@@ -0,0 +1,46 @@
+import pytest
+
+from checkpoint import load_checkpoint, sum_bytes_incrementally
+
+entry = '1.2.3.4 - - [07/May/2017:00:00:00 +0300] "GET / HTTP/1.0" 200 {} "-" "-"\n'
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    path = tmp_path / "access.log"
+    path.write_text(entry.format(100) * 3)
+    return str(path)
+
+
+def append(path: str, text: str) -> None:
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def test_resume_from_checkpoint(log_path: str, mocker) -> None:
+    assert sum_bytes_incrementally(log_path) == 300
+    append(log_path, entry.format(5))
+    extract = mocker.patch("checkpoint.extract_bytes_raw", return_value=5)
+    assert sum_bytes_incrementally(log_path) == 305
+    assert extract.call_count == 1
+
+
+def test_incomplete_line_is_left_for_next_run(log_path: str) -> None:
+    append(log_path, entry.format(7)[:-20])
+    assert sum_bytes_incrementally(log_path) == 300
+    append(log_path, entry.format(7)[-20:])
+    assert sum_bytes_incrementally(log_path) == 307
+
+
+def test_rewritten_file_is_scanned_again(log_path: str) -> None:
+    sum_bytes_incrementally(log_path)
+    with open(log_path, "r+") as f:
+        f.write(entry.format(999))
+    assert sum_bytes_incrementally(log_path) == 1199
+
+
+def test_damaged_checkpoint(log_path: str) -> None:
+    with open(log_path + ".checkpoint", "w") as f:
+        f.write("{")
+    assert load_checkpoint(log_path + ".checkpoint") is None
+    assert sum_bytes_incrementally(log_path) == 300
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import columnar
+from columnar import ColumnarLog, export_columns
+from main import sum_bytes_sent_and_received
+
+entry = '10.0.0.{ip} - - [{time:%d/%b/%Y:%H:%M:%S %z}] "GET /page/{page} HTTP/1.0" {status} {bytes_} "-" "-"'
+start_time = datetime(2017, 5, 7, 14, tzinfo=timezone(timedelta(hours=3)))
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    path = tmp_path / "access.log"
+    lines = [
+        entry.format(
+            ip=i % 3,
+            time=start_time + timedelta(seconds=i),
+            page=i % 5,
+            status=404 if i % 4 == 0 else 200,
+            bytes_=i * 10,
+        )
+        for i in range(100)
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def columns(log_path: str, tmp_path, mocker) -> ColumnarLog:
+    mocker.patch.object(columnar, "FLUSH_ROWS", 7)
+    assert export_columns(log_path, str(tmp_path / "columns")) == 100
+    return ColumnarLog(str(tmp_path / "columns"))
+
+
+def test_sum_bytes(columns: ColumnarLog, log_path: str) -> None:
+    assert columns.sum_bytes() == sum_bytes_sent_and_received(log_path)
+
+
+def test_columns(columns: ColumnarLog) -> None:
+    assert columns["timestamp"][5] == start_time.timestamp() + 5
+    assert columns["status"][4] == 404
+    assert columns.dictionaries["path"][columns["path"][7]] == b"/page/2"
+    assert columns.dictionaries["ip"][columns["ip"][7]] == b"10.0.0.1"
+
+
+def test_sum_bytes_in_range(columns: ColumnarLog) -> None:
+    start = start_time.timestamp()
+    assert columns.sum_bytes_in_range(start + 10, start + 20) == sum(range(100, 200, 10))
+
+
+def test_bytes_by_status(columns: ColumnarLog) -> None:
+    assert columns.bytes_by_status() == {
+        200: sum(i * 10 for i in range(100) if i % 4),
+        404: sum(i * 10 for i in range(0, 100, 4)),
+    }
+
+
+def test_top_by_bytes(columns: ColumnarLog) -> None:
+    assert columns.top_by_bytes("path", 1) == [(b"/page/4", sum(range(40, 1000, 50)))]
+
+
+def test_empty_log(tmp_path) -> None:
+    (tmp_path / "empty.log").write_text("")
+    export_columns(str(tmp_path / "empty.log"), str(tmp_path / "columns"))
+    columns = ColumnarLog(str(tmp_path / "columns"))
+    assert columns.sum_bytes() == 0
+    assert columns.top_by_bytes("ip") == []
+
+
+def test_blank_and_malformed_lines(log_path: str, tmp_path) -> None:
+    with open(log_path, "a") as f:
+        f.write("\n\n")
+    assert export_columns(log_path, str(tmp_path / "columns")) == 100
+    with open(log_path, "a") as f:
+        f.write("garbage\n")
+    with pytest.raises(ValueError, match="Malformed log entry"):
+        export_columns(log_path, str(tmp_path / "columns"))
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from follow import LogFollower, PollingWatcher, create_watcher
+
+short_entry = '1.2.3.4 - - [07/May/2017:00:00:00 +0300] "GET / HTTP/1.0" 200 5 "-" "-"'
+test_data = [
+    '213.109.238.193 - - [07/May/2017:00:08:35 +0300] "GET /question/edit.php HTTP/1.0" 303 440 "-" "Mozilla/5.0 (Windows NT 5.1; rv:52.0) Gecko/20100101 Firefox/52.0"',
+    '91.243.6.52 - - [07/May/2017:08:15:31 +0300] "GET /grade/report/user/index.php?id=3 HTTP/1.0" 200 60640 "http://learn.topnode.if.ua/course/view.php?id=3" "Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"',
+]
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    path = tmp_path / "access.log"
+    path.write_text(test_data[0] + "\n")
+    return str(path)
+
+
+def append(path: str, text: str) -> None:
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def test_follow_starts_at_end(log_path: str) -> None:
+    follower = LogFollower(log_path)
+    assert follower.read_new_lines() == 0
+    append(log_path, test_data[1] + "\n")
+    assert follower.read_new_lines() == 60640
+    follower.close()
+
+
+def test_partial_line_is_buffered(log_path: str) -> None:
+    follower = LogFollower(log_path, from_start=True)
+    append(log_path, test_data[1][:50])
+    assert follower.read_new_lines() == 440
+    append(log_path, test_data[1][50:] + "\n")
+    assert follower.read_new_lines() == 60640
+    assert follower.total == 61080
+    follower.close()
+
+
+def test_rotation(log_path: str) -> None:
+    follower = LogFollower(log_path)
+    append(log_path, test_data[1] + "\n")
+    os.rename(log_path, log_path + ".1")
+    with open(log_path, "w") as f:
+        f.write(test_data[0] + "\n")
+    assert follower.check_file() == 60640
+    assert follower.read_new_lines() == 440
+    follower.close()
+
+
+def test_truncation(log_path: str) -> None:
+    follower = LogFollower(log_path, from_start=True)
+    follower.read_new_lines()
+    with open(log_path, "w") as f:
+        f.write(short_entry + "\n")
+    follower.check_file()
+    follower.read_new_lines()
+    assert follower.total == 445
+    follower.close()
+
+
+def test_follow_reports_total(log_path: str) -> None:
+    follower = LogFollower(log_path, from_start=True)
+    total, rate = next(follower.follow(interval=0, watcher=PollingWatcher()))
+    assert total == 440 and rate >= 0
+    follower.close()
+
+
+def test_create_watcher(log_path: str) -> None:
+    watcher = create_watcher(log_path)
+    watcher.wait(0)
+    watcher.close()
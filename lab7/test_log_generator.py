@@ -0,0 +1,35 @@
+from itertools import islice
+
+import pytest
+
+from aggregation import extract_status
+from log_generator import generate_entries, generate_log
+from main import (
+    extract_bytes,
+    sum_bytes_sent_and_received,
+    sum_bytes_sent_and_received_parallel,
+)
+
+
+def test_generation_is_deterministic() -> None:
+    entries = list(islice(generate_entries(seed=1), 100))
+    assert entries == list(islice(generate_entries(seed=1), 100))
+    assert entries != list(islice(generate_entries(seed=2), 100))
+
+
+@pytest.mark.parametrize("malformed_ratio", [0.0, 0.5, 1.0])
+def test_entries_are_parsed(malformed_ratio: float) -> None:
+    for entry in islice(generate_entries(malformed_ratio=malformed_ratio), 1000):
+        expected = int(entry.rsplit(' "', 2)[0].rsplit(" ", 1)[1])
+        assert extract_bytes(entry) == expected
+        if malformed_ratio == 1.0:
+            assert extract_status(entry.encode()) == b"400"
+
+
+def test_generate_log(tmp_path) -> None:
+    path = str(tmp_path / "nginx.txt")
+    lines = generate_log(path, 100_000, malformed_ratio=0.1)
+    assert 100_000 <= (tmp_path / "nginx.txt").stat().st_size < 105_000
+    with open(path) as f:
+        assert sum(1 for _ in f) == lines
+    assert sum_bytes_sent_and_received_parallel(path, 3) == sum_bytes_sent_and_received(path)
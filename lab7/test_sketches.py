@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from sketches import CountMinSketch, HyperLogLog, LogSketches, SpaceSaving, sketch_log
+
+entry = '{} - - [07/May/2017:00:00:00 +0300] "GET / HTTP/1.0" 200 {} "-" "-"'
+
+
+@pytest.mark.parametrize("count", [0, 10, 1000, 50000])
+def test_hyper_log_log(count: int) -> None:
+    sketch = HyperLogLog()
+    for i in range(count):
+        sketch.add(str(i).encode())
+        sketch.add(str(i).encode())
+    assert sketch.count() == pytest.approx(count, rel=0.03)
+
+
+def test_hyper_log_log_merge() -> None:
+    first, second = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        first.add(str(i).encode())
+        second.add(str(i + 1000).encode())
+    assert first.merge(second).count() == pytest.approx(4000, rel=0.03)
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(10))
+
+
+def test_count_min_sketch() -> None:
+    sketch = CountMinSketch(width=64, depth=4)
+    for i in range(500):
+        sketch.add(str(i).encode(), 2)
+    sketch.add(b"heavy", 10000)
+    assert 10000 <= sketch.estimate(b"heavy") <= 10000 + 2 * 1000 * 2.72 / 64
+    other = CountMinSketch(width=64, depth=4)
+    other.add(b"heavy", 5)
+    assert sketch.merge(other).estimate(b"heavy") >= 10005
+
+
+def test_space_saving() -> None:
+    sketch = SpaceSaving(capacity=5)
+    for i in range(100):
+        sketch.add(str(i).encode(), 1)
+    sketch.add(b"heavy", 1000)
+    sketch.add(b"medium", 500)
+    assert [value for value, _ in sketch.top(2)] == [b"heavy", b"medium"]
+    other = SpaceSaving(capacity=5)
+    other.add(b"medium", 1000)
+    assert sketch.merge(other).top(1)[0][0] == b"medium"
+    assert len(sketch.counters) == 5
+
+
+def test_space_saving_keeps_heavy_values() -> None:
+    rng = random.Random(7)
+    # half of the stream are three heavy values, the rest are distinct
+    stream = [
+        rng.choice([b"a", b"b", b"c"]) if rng.random() < 0.5 else str(rng.random()).encode()
+        for _ in range(5000)
+    ]
+    sketch = SpaceSaving(capacity=20)
+    for value in stream:
+        sketch.add(value, 3)
+    assert sum(sketch.counters.values()) == 3 * len(stream)
+    assert len(sketch.heap) == len(sketch.counters) == 20
+    for value in (b"a", b"b", b"c"):
+        assert sketch.counters[value] >= 3 * stream.count(value)
+
+
+def test_log_sketches(tmp_path) -> None:
+    path = tmp_path / "access.log"
+    lines = [entry.format(f"10.0.0.{i % 20}", 10 + (i % 20 == 7) * 1000) for i in range(200)]
+    path.write_text("\n".join(lines))
+    sketches = sketch_log(str(path))
+    assert sketches.unique.count() == 20
+    assert sketches.top_talkers.top(1)[0][0] == b"10.0.0.7"
+    assert sketches.bytes.estimate(b"10.0.0.7") >= 10 * 1010
+    sketches.save(str(tmp_path / "day.sketch"))
+    week = LogSketches.load(str(tmp_path / "day.sketch"))
+    week.merge(sketches)
+    assert week.unique.count() == 20
+    assert week.top_talkers.top(1) == [(b"10.0.0.7", 20 * 1010)]
+    with pytest.raises(TypeError):
+        HyperLogLog.load(str(tmp_path / "day.sketch"))
+
+
+def test_log_sketches_blank_and_malformed_entries() -> None:
+    sketches = LogSketches("path").add_lines([b"", entry.format("10.0.0.1", 5).encode()])
+    assert sketches.top_talkers.top() == [(b"/", 5)]
+    with pytest.raises(ValueError, match="Malformed log entry"):
+        sketches.add(b"10.0.0.1 - - [07/May/2017:08:15:31 +0300]")
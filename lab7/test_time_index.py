@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from time_index import (
+    TimeIndex,
+    load_index,
+    parse_time,
+    sum_bytes_in_range,
+    sum_bytes_indexed,
+)
+
+entry = '1.2.3.4 - - [{:%d/%b/%Y:%H:%M:%S %z}] "GET / HTTP/1.0" 200 {} "-" "-"\n'
+start_time = datetime(2017, 5, 7, 14, tzinfo=timezone(timedelta(hours=3)))
+
+
+def write_log(path, minutes: range) -> None:
+    with open(path, "a") as f:
+        for minute in minutes:
+            f.write(entry.format(start_time + timedelta(minutes=minute), minute))
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    path = str(tmp_path / "access.log")
+    write_log(path, range(100))
+    return path
+
+
+def test_parse_time() -> None:
+    assert parse_time(entry.format(start_time, 0).encode()) == start_time.timestamp()
+
+
+def test_update_returns_bytes(log_path: str) -> None:
+    index = TimeIndex(every=10)
+    assert index.update(log_path) == sum(range(100))
+    assert len(index.offsets) == 10
+    write_log(log_path, range(100, 105))
+    assert index.update(log_path) == sum(range(100, 105))
+    assert len(index.offsets) == 11 and index.lines == 105
+    assert index.total == sum(range(105))
+
+
+@pytest.mark.parametrize("first, last", [(0, 100), (20, 35), (33, 34), (95, 200), (-10, 5)])
+def test_sum_bytes_in_range(log_path: str, first: int, last: int) -> None:
+    index = TimeIndex(every=7)
+    index.update(log_path)
+    start = start_time + timedelta(minutes=first)
+    end = start_time + timedelta(minutes=last)
+    expected = sum(range(max(first, 0), min(last, 100)))
+    assert sum_bytes_in_range(log_path, start, end, index) == expected
+
+
+def test_locate_skips_most_of_file(log_path: str) -> None:
+    index = TimeIndex(every=10)
+    index.update(log_path)
+    start, end = index.locate(
+        (start_time + timedelta(minutes=42)).timestamp(),
+        (start_time + timedelta(minutes=45)).timestamp(),
+    )
+    assert (start, end) == (index.offsets[4], index.offsets[5])
+
+
+def test_load_index_is_extended(log_path: str) -> None:
+    index = load_index(log_path, every=10)
+    write_log(log_path, range(100, 120))
+    index = load_index(log_path, every=10)
+    assert index.lines == 120
+    start = start_time + timedelta(minutes=110)
+    assert sum_bytes_in_range(log_path, start, start + timedelta(hours=1)) == sum(range(110, 120))
+
+
+def test_truncated_file_is_indexed_again(log_path: str) -> None:
+    index = TimeIndex(every=10)
+    index.update(log_path)
+    open(log_path, "w").close()
+    write_log(log_path, range(3))
+    assert index.update(log_path) == 3
+    assert index.lines == 3 and index.total == 3
+
+
+def test_sum_bytes_indexed(log_path: str, mocker) -> None:
+    assert sum_bytes_indexed(log_path) == sum(range(100))
+    write_log(log_path, range(100, 110))
+    extract = mocker.patch("time_index.extract_bytes_raw", return_value=1)
+    assert sum_bytes_indexed(log_path) == sum(range(100)) + 10
+    assert extract.call_count == 10
+
+
+def test_index_of_unknown_format_is_rebuilt(log_path: str) -> None:
+    index_path = log_path + ".index"
+    with open(index_path, "w") as f:
+        f.write('{"every": 10, "inode": null, "end_offset": 0}')
+    assert sum_bytes_indexed(log_path) == sum(range(100))
+    assert TimeIndex.load(index_path).lines == 100
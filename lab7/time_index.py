@@ -0,0 +1,148 @@
+"""Module for a sparse index of nginx log timestamps used to answer time range queries."""
+
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from aggregation import extract_time
+from main import extract_bytes_raw
+
+
+def parse_local_time(time: bytes) -> int:
+    """Parse the local time, e.g. 07/May/2017:08:15:31 +0300, into a Unix timestamp"""
+    return int(datetime.strptime(time.decode(), "%d/%b/%Y:%H:%M:%S %z").timestamp())
+
+
+def parse_time(entry: bytes) -> int:
+    """Parse the local time of the entry into a Unix timestamp"""
+    return parse_local_time(extract_time(entry))
+
+
+class TimeIndex:
+    """
+    Sparse index that maps the timestamp of every n-th line to its offset.
+
+    The total of bytes sent in the indexed lines is kept as well, so the sum of
+    the whole file only needs the lines appended since the last update.
+    The log file is expected to be ordered by time, as nginx writes it.
+    """
+
+    def __init__(self, every: int = 1000) -> None:
+        self.every = every
+        self.inode = None
+        self.end_offset = 0
+        self.lines = 0
+        self.total = 0
+        self.timestamps = []
+        self.offsets = []
+
+    def update(self, nginx_log_path: str) -> int:
+        """
+        Index lines appended since the last update, starting over if the file was replaced
+        or truncated. An incomplete last line is left for the next update.
+
+        :param nginx_log_path: path to the log file of nginx
+        :return: number of bytes sent in the newly indexed lines
+        """
+        bytes_sum = 0
+        with open(nginx_log_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.end_offset:
+                self.inode = stat.st_ino
+                self.end_offset = self.lines = self.total = 0
+                self.timestamps, self.offsets = [], []
+            f.seek(self.end_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if self.lines % self.every == 0:
+                    self.timestamps.append(parse_time(line))
+                    self.offsets.append(self.end_offset)
+                bytes_sum += extract_bytes_raw(line)
+                self.end_offset += len(line)
+                self.lines += 1
+        self.total += bytes_sum
+        return bytes_sum
+
+    def locate(self, start: float, end: float) -> tuple[int, int]:
+        """
+        Find the region of the indexed part of the file that contains lines
+        with timestamps in [start, end).
+
+        :return: (start offset, end offset)
+        """
+        first = max(bisect_left(self.timestamps, start) - 1, 0)
+        last = bisect_right(self.timestamps, end)
+        start_offset = self.offsets[first] if self.offsets else 0
+        end_offset = self.offsets[last] if last < len(self.offsets) else self.end_offset
+        return start_offset, end_offset
+
+    def save(self, index_path: str) -> None:
+        temp_path = index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.__dict__, f)
+        os.replace(temp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path: str) -> "TimeIndex":
+        index = cls()
+        with open(index_path, "r") as f:
+            state = json.load(f)
+        if state.keys() != index.__dict__.keys():
+            raise ValueError(f"Index of an unknown format: {index_path}")
+        index.__dict__.update(state)
+        return index
+
+
+def load_index(nginx_log_path: str, every: int = 1000, index_path: str | None = None) -> TimeIndex:
+    """Load the sidecar index of the log file, extend it with new lines and save it"""
+    index_path = index_path or nginx_log_path + ".index"
+    try:
+        index = TimeIndex.load(index_path)
+    except (OSError, ValueError):
+        index = TimeIndex(every)
+    index.update(nginx_log_path)
+    index.save(index_path)
+    return index
+
+
+def sum_bytes_indexed(nginx_log_path: str, index_path: str | None = None) -> int:
+    """
+    Calculate the total number of bytes sent in the log file of nginx, building
+    the sidecar index or extending it with the lines appended since it was saved.
+
+    :param nginx_log_path: path to the log file of nginx
+    :param index_path: path to the index, the file path with .index by default
+    :return: number of bytes
+    """
+    return load_index(nginx_log_path, index_path=index_path).total
+
+
+def sum_bytes_in_range(
+    nginx_log_path: str, start: datetime, end: datetime, index: TimeIndex | None = None
+) -> int:
+    """
+    Calculate the number of bytes sent between start (inclusive) and end (exclusive),
+    parsing only the region of the file found with the index.
+
+    :param nginx_log_path: path to the log file of nginx
+    :param start: timezone-aware start of the range
+    :param end: timezone-aware end of the range
+    :param index: index of the file, the sidecar index is loaded and updated if omitted
+    :return: number of bytes
+    """
+    index = index or load_index(nginx_log_path)
+    start_timestamp, end_timestamp = start.timestamp(), end.timestamp()
+    start_offset, end_offset = index.locate(start_timestamp, end_timestamp)
+    bytes_sum = 0
+    with open(nginx_log_path, "rb") as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for line in f:
+            if offset >= end_offset:
+                break
+            offset += len(line)
+            if start_timestamp <= parse_time(line) < end_timestamp:
+                bytes_sum += extract_bytes_raw(line)
+    return bytes_sum